@@ -0,0 +1,410 @@
+"""
+Benchmark suite for the triangle-counting solvers.
+
+Every solver x graph family x size x (p, q) case runs in its own subprocess with a
+timeout. A case runs the query workload (an unconditioned query, then one query
+after each of three observations) and records wall time, CPU time, peak RSS,
+samples per second for the sampling solvers, and the worst total-variation
+distance from the exact answer. Exact answers are only computed for small
+supports; other cases record reference = null and the reason in
+reference_reason, and are reported as unchecked rather than accurate.
+Results are written as JSON (with the environment they were measured in) or CSV,
+and can be compared against a stored JSON baseline to catch regressions in time
+or accuracy. benchplots.py plots the mean wall time per size from the JSON.
+
+    python bench.py --solvers mc bn --sizes 4 8 16 --output results.json
+    python bench.py --solvers mc --baseline results.json
+"""
+
+from argparse import SUPPRESS, ArgumentParser
+import csv
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# exact references are computed for supports with at most this many edges
+REFERENCE_MAX_EDGES = 16
+
+FIELDS = [
+    "solver",
+    "family",
+    "n",
+    "p",
+    "q",
+    "status",
+    "wall_time",
+    "cpu_time",
+    "peak_rss_mb",
+    "samples_per_sec",
+    "tv_error",
+    "reference",
+    "reference_reason",
+    "error",
+]
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+# two blocks of n / 2 nodes with edge probability p inside a block and q across
+def sbm_graph(n, p, q):
+    prob_adj_list = {source: {} for source in range(n)}
+    for source in range(n):
+        for target in range(source + 1, n):
+            same_block = (source < n // 2) == (target < n // 2)
+            prob_adj_list[source][target] = p if same_block else q
+    return prob_adj_list
+
+
+def er_graph(n, p, q):
+    return {
+        source: {target: p for target in range(source + 1, n)} for source in range(n)
+    }
+
+
+# Barabasi-Albert support (m = 2) whose edges each exist with probability p
+def ba_graph(n, p, q):
+    from growth import barabasi_albert
+
+    prob_adj_list = {source: {} for source in range(n)}
+    sources, targets = barabasi_albert(n, 2, np.random.default_rng(0))
+    for source, target in zip(sources.tolist(), targets.tolist()):
+        prob_adj_list[min(source, target)][max(source, target)] = p
+    return prob_adj_list
+
+
+FAMILIES = {"sbm": sbm_graph, "er": er_graph, "ba": ba_graph}
+
+
+def make_solver(name, G):
+    if name == "mc":
+        from mc import MonteCarlo
+
+        return MonteCarlo()
+    if name == "mc-batched":
+        from mc import MonteCarlo
+
+        return MonteCarlo(batch_size=1000)
+    if name == "bn":
+        from bn import BayesianNetwork
+
+        return BayesianNetwork()
+    if name == "database":
+        from database import ProbabilisticDatabase
+
+        return ProbabilisticDatabase(G)
+    if name == "streaming":
+        from database import StreamingProbabilisticDatabase
+
+        return StreamingProbabilisticDatabase(G)
+    if name == "elimination":
+        from elimination import BucketElimination
+
+        return BucketElimination()
+    if name == "decomposition":
+        from distributions import Decomposition
+        from mc import MonteCarlo
+
+        return Decomposition(fallback=MonteCarlo(batch_size=1000))
+    if name == "sdd":
+        from cnfgen import Propositional
+
+        return Propositional(G)
+    raise ValueError(f"Unknown solver {name}.")
+
+
+SOLVERS = [
+    "mc",
+    "mc-batched",
+    "bn",
+    "database",
+    "streaming",
+    "elimination",
+    "decomposition",
+    "sdd",
+    "mcmc",
+]
+
+
+# the query workload: yields after each observation, starting unconditioned
+def observations(solver, G):
+    yield
+    solver.observe_edge(G, 0, 1)
+    yield
+    solver.observe_no_edge(G, 0, 2)
+    yield
+    solver.observe_triangle(G, 1, 2, 3)
+    yield
+
+
+def total_variation(dist, reference):
+    keys = set(dist) | set(reference)
+    return 0.5 * sum(abs(dist.get(k, 0.0) - reference.get(k, 0.0)) for k in keys)
+
+
+def run_case(case):
+    """
+    Runs one case in this process and returns its result row. Meant to be called in
+    a fresh subprocess, so peak RSS covers this case only.
+    """
+    from random_graph import SampleableRandomGraph
+
+    if case["solver"] == "mcmc":
+        return run_mcmc_case(case)
+
+    prob_adj_list = FAMILIES[case["family"]](case["n"], case["p"], case["q"])
+    G = SampleableRandomGraph(prob_adj_list)
+
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    solver = make_solver(case["solver"], G)
+    dists = []
+    for i, _ in enumerate(observations(solver, G)):
+        dists.append(solver.pr(G, use_cached=i > 0))
+    wall_time = time.perf_counter() - start_wall
+    cpu_time = time.process_time() - start_cpu
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    samples_per_sec = None
+    if hasattr(solver, "num_samples"):
+        samples_per_sec = solver.num_samples * len(dists) / wall_time
+
+    # exact reference, outside of the timed section
+    tv_error = None
+    reference = "streaming"
+    reference_reason = None
+    if G.graph.num_edges <= REFERENCE_MAX_EDGES:
+        reference_G = SampleableRandomGraph(prob_adj_list)
+        reference_solver = make_solver(reference, reference_G)
+        tv_error = max(
+            total_variation(dist, reference_solver.pr(reference_G))
+            for dist, _ in zip(dists, observations(reference_solver, reference_G))
+        )
+    else:
+        reference = None
+        reference_reason = (
+            f"support has {G.graph.num_edges} edges, more than "
+            f"REFERENCE_MAX_EDGES = {REFERENCE_MAX_EDGES}"
+        )
+
+    return dict(
+        case,
+        status="ok",
+        wall_time=wall_time,
+        cpu_time=cpu_time,
+        peak_rss_mb=peak_rss_mb,
+        samples_per_sec=samples_per_sec,
+        tv_error=tv_error,
+        reference=reference,
+        reference_reason=reference_reason,
+    )
+
+
+# MCMC samples an exponential random graph with L = p * n^2 links around a random
+# initial graph, as benchmark_mcmc.py did; it has no exact reference
+def run_mcmc_case(case):
+    import torch
+    from torch.distributions.categorical import Categorical
+    from torch_geometric.utils import coalesce, remove_self_loops
+    from mcmc import MarkovChainMonteCarlo
+    from random_graph import ExponentialRandomGraph
+
+    N = case["n"]
+    L = int(case["p"] * N * N)
+    generator = torch.Generator().manual_seed(0)
+    idx = torch.randperm(N * N, generator=generator)[: L // 2]
+    u, v = idx // N, idx % N
+    edge_index = torch.stack([torch.cat([u, v]), torch.cat([v, u])])
+    edge_index, _ = remove_self_loops(coalesce(edge_index))
+
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    G = ExponentialRandomGraph(edge_index, N, L, Categorical(torch.ones(N) / N))
+    solver = MarkovChainMonteCarlo(seed=0)
+    solver.pr(G)
+    wall_time = time.perf_counter() - start_wall
+
+    return dict(
+        case,
+        status="ok",
+        wall_time=wall_time,
+        cpu_time=time.process_time() - start_cpu,
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        samples_per_sec=solver.num_samples * solver.num_chains / wall_time,
+        tv_error=None,
+        reference=None,
+        reference_reason="no exact solver for exponential random graphs",
+    )
+
+
+# runs a case in a subprocess, killing it after timeout seconds; a case killed by
+# a signal (e.g. by the OOM killer) is reported as crashed
+def run_isolated(case, timeout):
+    command = [sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)]
+    try:
+        proc = subprocess.run(
+            command,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    except subprocess.TimeoutExpired:
+        return dict(case, status="timeout", wall_time=timeout)
+    if proc.returncode < 0:
+        return dict(
+            case, status="crashed", error=f"killed by signal {-proc.returncode}"
+        )
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return dict(case, status="error", error=lines[-1] if lines else "")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def environment():
+    import torch
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def case_key(row):
+    return row["solver"], row["family"], row["n"], row["p"], row["q"]
+
+
+def compare(results, baseline, tolerance, tv_tolerance):
+    """
+    Matches results to baseline rows by case and returns the regressions: cases
+    that got slower than (1 + tolerance) times the baseline wall time, that
+    stopped finishing, whose total-variation error grew by more than
+    tv_tolerance, or that lost the exact reference the baseline was checked
+    against.
+    """
+    previous = {case_key(row): row for row in baseline}
+    regressions = []
+    for row in results:
+        old = previous.get(case_key(row))
+        if old is None or old["status"] != "ok":
+            continue
+        if row["status"] != "ok":
+            regressions.append((row, old, row["status"]))
+            continue
+        if row["wall_time"] > (1 + tolerance) * old["wall_time"]:
+            ratio = row["wall_time"] / old["wall_time"]
+            regressions.append((row, old, f"{ratio:.2f}x slower"))
+        if old.get("tv_error") is None:
+            continue
+        if row.get("tv_error") is None:
+            reason = row.get("reference_reason") or "no reference"
+            regressions.append((row, old, f"accuracy unchecked: {reason}"))
+        elif row["tv_error"] > old["tv_error"] + tv_tolerance:
+            regressions.append(
+                (row, old, f"tv error {old['tv_error']:.3f} -> {row['tv_error']:.3f}")
+            )
+    return regressions
+
+
+def write_results(results, path, fmt):
+    f = open(path, "w", encoding="utf-8", newline="") if path else sys.stdout
+    try:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            for row in results:
+                writer.writerow({field: row.get(field) for field in FIELDS})
+        else:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+            f.write("\n")
+    finally:
+        if path:
+            f.close()
+
+
+def main(argv=None):
+    parser = ArgumentParser(
+        prog="bench", description="Benchmarks the triangle-counting solvers."
+    )
+    parser.add_argument("--solvers", nargs="+", choices=SOLVERS, default=["mc"])
+    parser.add_argument(
+        "--families", nargs="+", choices=sorted(FAMILIES), default=["sbm"]
+    )
+    parser.add_argument("--sizes", nargs="+", type=int, default=[4, 8, 16])
+    parser.add_argument("--ps", nargs="+", type=float, default=[0.2, 0.6, 1.0])
+    parser.add_argument("--qs", nargs="+", type=float, default=[0.2, 0.6, 1.0])
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--format", choices=["json", "csv"], default="json")
+    parser.add_argument("-o", "--output", type=str)
+    parser.add_argument("--baseline", type=str)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--tv-tolerance", type=float, default=0.05)
+    parser.add_argument("--case", type=str, help=SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return 0
+
+    results = []
+    for solver in args.solvers:
+        # MCMC always samples an exponential random graph
+        families = ["erg"] if solver == "mcmc" else args.families
+        for family in families:
+            for n in args.sizes:
+                for p in args.ps:
+                    # q only matters for the block model
+                    for q in args.qs if family == "sbm" else [args.qs[0]]:
+                        case = {
+                            "solver": solver,
+                            "family": family,
+                            "n": n,
+                            "p": p,
+                            "q": q,
+                        }
+                        row = run_isolated(case, args.timeout)
+                        eprint(
+                            f"{solver} {family} n={n} p={p} q={q}: {row['status']}"
+                            f" {row.get('wall_time', float('nan')):.3f}s"
+                        )
+                        if row["status"] == "ok" and row.get("reference") is None:
+                            eprint(f"  accuracy unchecked: {row['reference_reason']}")
+                        results.append(row)
+
+    write_results(results, args.output, args.format)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance, args.tv_tolerance)
+        for row, old, reason in regressions:
+            eprint(
+                f"regression: {' '.join(map(str, case_key(row)))}: {reason}"
+                f" (baseline {old['wall_time']:.3f}s)"
+            )
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,14 @@
 """
 Generate plots used for presentation/final report.
+
+Reads bench.py's JSON output, {"environment": ..., "results": [row, ...]}, and
+plots the mean and standard deviation of wall_time over the finished cases of
+each size n. Older files that are already lists of {"n", "mean", "std"} entries
+are plotted as they are.
 """
 
 import json
+import numpy as np
 import matplotlib.pyplot as plt
 
 plt.rcParams.update(
@@ -12,21 +18,33 @@ plt.rcParams.update(
 )
 
 
+def load_bench(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data
+
+    # timed-out, crashed and failed cases have no meaningful wall time
+    times = {}
+    for row in data["results"]:
+        if row["status"] == "ok":
+            times.setdefault(row["n"], []).append(row["wall_time"])
+    return [
+        {"n": n, "mean": np.mean(times[n]), "std": np.std(times[n])}
+        for n in sorted(times)
+    ]
+
+
 def main():
-    with open("benches/mc.json", encoding="utf-8") as f:
-        mc = json.load(f)
+    mc = load_bench("benches/mc.json")
 
-    # with open("benches/mcmc.json", encoding="utf-8") as f:
-    #     mcmc = json.load(f)
+    # mcmc = load_bench("benches/mcmc.json")
 
-    with open("benches/database.json", encoding="utf-8") as f:
-        database = json.load(f)
+    database = load_bench("benches/database.json")
 
-    with open("benches/bn.json", encoding="utf-8") as f:
-        bn = json.load(f)
+    bn = load_bench("benches/bn.json")
 
-    with open("benches/sdd.json", encoding="utf-8") as f:
-        sdd = json.load(f)
+    sdd = load_bench("benches/sdd.json")
 
     def plot_bench(data, label):
         plt.errorbar(
@@ -1,81 +1,151 @@
 from pgmpy.models import BayesianNetwork as BN
 from pgmpy.factors.discrete import TabularCPD
 from pgmpy.inference import VariableElimination
+from compile_cache import structure_key
+from profiling import Stats
+from utils import to_dist
 import itertools
 import numpy as np
 
 
 class BayesianNetwork:
-    def pr(self, G, use_cached=False):
-        if not use_cached:
-            cpds = {}
-            for u1, u2 in itertools.combinations(list(range(G.num_nodes)), 2):
-                edge_node = str(u1) + "_" + str(u2)
-
-                if u2 in G.out_adj_list[u1]:
-                    prob = G.out_adj_list[u1][u2]
-                elif u1 in G.out_adj_list[u2]:
-                    prob = G.out_adj_list[u2][u1]
-                else:
-                    prob = 0.0
-
-                cpds[edge_node] = TabularCPD(
-                    variable=edge_node,
-                    variable_card=2,
-                    values=[[1 - prob], [prob]],
-                )
-
-            edges = []
-            tri_nodes = []
-            for subset in itertools.combinations(list(range(G.num_nodes)), 3):
-                n1, n2, n3 = subset
-                tri_node = str(n1) + "_" + str(n2) + "_" + str(n3)
-                tri_nodes.append(tri_node)
-
-                evidence = []
-                for u1, u2 in itertools.combinations(subset, 2):
-                    edge_node = str(u1) + "_" + str(u2)
-                    evidence.append(edge_node)
-
-                cpds[tri_node] = TabularCPD(
-                    variable=tri_node,
-                    variable_card=2,
-                    values=[
-                        [1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 0.0],
-                        [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0],
-                    ],
-                    evidence=evidence,
-                    evidence_card=[2, 2, 2],
-                )
-
-                for edge_node in evidence:
-                    edges.append((edge_node, tri_node))
-
-            num_tri_nodes = len(tri_nodes)
-            sum_cpd = np.array(
-                [list(i) for i in itertools.product([0, 1], repeat=num_tri_nodes)]
+    def __init__(self, cache=None):
+        # optional CompilationCache for the probability-independent part of the model
+        self.cache = cache
+        self.support = set()
+        self.stats = Stats()
+
+    def pr(self, G, use_cached=False, dense=False):
+        # a positive observation outside the modelled support changes the structure
+        stale = any(
+            pos == 1 and edge_node(s, t) not in self.support
+            for (s, t), pos in G.observations
+        )
+        if not use_cached or stale:
+            self.stats.count("compilations")
+            support = self.edge_support(G)
+            with self.stats.phase("structure"):
+                graph_model = self.structure(G, support)
+
+            with self.stats.phase("cpds"):
+                cpds = []
+                for u1, u2 in support:
+                    prob = edge_prob(G, u1, u2)
+                    cpds.append(
+                        TabularCPD(
+                            variable=edge_node(u1, u2),
+                            variable_card=2,
+                            values=[[1 - prob], [prob]],
+                        )
+                    )
+
+                graph_model.add_cpds(*cpds)
+                self.graph_infer = VariableElimination(graph_model)
+            self.support = {edge_node(u1, u2) for u1, u2 in support}
+
+        # edges outside the support are absent in every world, so "no edge"
+        # observations on them carry no information
+        evidence = {
+            edge_node(s, t): pos
+            for (s, t), pos in G.observations
+            if edge_node(s, t) in self.support
+        }
+        with self.stats.phase("query"):
+            q = self.graph_infer.query(variables=["sum"], evidence=evidence)
+        dist = dict(zip(list(range(len(q.values))), q.values.tolist()))
+        return to_dist(dist, 1.0, G.num_nodes, dense)
+
+    # edges with nonzero probability or a positive observation, as pairs u1 < u2
+    def edge_support(self, G):
+        observed = {
+            (min(s, t), max(s, t)) for (s, t), pos in G.observations if pos == 1
+        }
+        sources, targets, probs = G.graph.edge_arrays()
+        support = {
+            (min(s, t), max(s, t))
+            for s, t in zip(sources[probs > 0].tolist(), targets[probs > 0].tolist())
+        }
+        return sorted(support | observed)
+
+    # network structure with triangle and running-count CPDs; edge CPDs are left
+    # to the caller
+    def structure(self, G, support):
+        key = structure_key(G.num_nodes, support, "triangles")
+        if self.cache is not None:
+            graph_model = self.cache.load_pickle(key, "bn.pkl")
+            if graph_model is not None:
+                self.stats.count("cache_hits")
+                return graph_model
+
+        support = set(support)
+        cpds = {}
+        edges = []
+        tri_nodes = []
+        for subset in itertools.combinations(list(range(G.num_nodes)), 3):
+            # only triangles whose three edges can all exist get a node
+            evidence = [
+                edge_node(u1, u2) for u1, u2 in itertools.combinations(subset, 2)
+            ]
+            if not all(pair in support for pair in itertools.combinations(subset, 2)):
+                continue
+
+            n1, n2, n3 = subset
+            tri_node = str(n1) + "_" + str(n2) + "_" + str(n3)
+            tri_nodes.append(tri_node)
+
+            cpds[tri_node] = TabularCPD(
+                variable=tri_node,
+                variable_card=2,
+                values=[
+                    [1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 0.0],
+                    [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0],
+                ],
+                evidence=evidence,
+                evidence_card=[2, 2, 2],
             )
-            sum_cpd = sum_cpd.sum(axis=1)
-            sum_cpd = np.eye(num_tri_nodes + 1)[sum_cpd].T
-
-            cpds["sum"] = TabularCPD(
-                variable="sum",
-                variable_card=num_tri_nodes + 1,
-                values=sum_cpd.tolist(),
-                evidence=tri_nodes,
-                evidence_card=[2 for _ in range(num_tri_nodes)],
+
+            for edge in evidence:
+                edges.append((edge, tri_node))
+
+        # the count is a chain of partial sums, sum_i = sum_{i-1} + tri_i, so each
+        # CPD is (i + 1) x 2i instead of one (T + 1) x 2^T table
+        count_node = None
+        for i, tri_node in enumerate(tri_nodes, start=1):
+            node = "sum" if i == len(tri_nodes) else "sum_" + str(i)
+            if count_node is None:
+                values = [[1.0, 0.0], [0.0, 1.0]]
+                evidence = [tri_node]
+                evidence_card = [2]
+            else:
+                values = np.zeros((i + 1, 2 * i))
+                for count in range(i):
+                    values[count, 2 * count] = 1.0
+                    values[count + 1, 2 * count + 1] = 1.0
+                values = values.tolist()
+                evidence = [count_node, tri_node]
+                evidence_card = [i, 2]
+                edges.append((count_node, node))
+            edges.append((tri_node, node))
+
+            cpds[node] = TabularCPD(
+                variable=node,
+                variable_card=i + 1,
+                values=values,
+                evidence=evidence,
+                evidence_card=evidence_card,
             )
-            for tri_node in tri_nodes:
-                edges.append((tri_node, "sum"))
+            count_node = node
 
-            graph_model = BN(edges)
-            graph_model.add_cpds(*list(cpds.values()))
-            self.graph_infer = VariableElimination(graph_model)
+        graph_model = BN(edges)
+        graph_model.add_nodes_from(edge_node(u1, u2) for u1, u2 in support)
+        if not tri_nodes:
+            graph_model.add_node("sum")
+            cpds["sum"] = TabularCPD(variable="sum", variable_card=1, values=[[1.0]])
+        graph_model.add_cpds(*list(cpds.values()))
 
-        evidence = {str(s) + "_" + str(t): pos for (s, t), pos in G.observations}
-        q = self.graph_infer.query(variables=["sum"], evidence=evidence)
-        dist = dict(zip(list(range(len(q.values))), q.values))
-        return dist
+        if self.cache is not None:
+            self.cache.store_pickle(key, "bn.pkl", graph_model)
+        return graph_model
 
     def observe_edge(self, G, s, t):
         return G.observe_edge(s, t)
@@ -85,3 +155,14 @@ class BayesianNetwork:
 
     def observe_triangle(self, G, a, b, c):
         return G.observe_triangle(a, b, c)
+
+
+def edge_node(u1, u2):
+    return str(min(u1, u2)) + "_" + str(max(u1, u2))
+
+
+def edge_prob(G, u1, u2):
+    prob = G.graph.prob(u1, u2)
+    if prob == 0.0 and not G.undirected:
+        prob = G.graph.prob(u2, u1)
+    return prob
@@ -6,10 +6,15 @@ from argparse import ArgumentParser, BooleanOptionalAction
 import sys
 import time
 import numpy as np
-from math import comb
 
-# only for bench
-from pysdd.sdd import SddManager, Vtree, WmcManager
+from pysdd.sdd import SddManager, Vtree
+from compile_cache import structure_key
+from profiling import Stats
+from random_graph import SampleableRandomGraph
+from utils import to_dist
+
+# elements of a circuit level are multiplied this many at a time
+ELEMENT_CHUNK = 1 << 15
 
 
 def eprint(*args, **kwargs):
@@ -19,31 +24,307 @@ def eprint(*args, **kwargs):
 class Propositional:
     """
     Weighted model count solver for triangle counting.
-    Currently doesn't work! I've pushed a version that enumerates the approach we tried.
+    Compiles a single SDD over one variable per edge in the graph's support and one
+    variable per possible triangle, where each triangle variable holds exactly when
+    its three edges do. Edge literals are weighted by their probabilities and true
+    triangle literals by a formal variable x, so the WMC is a polynomial whose
+    coefficients are the triangle-count distribution. Observations only change edge
+    weights; the circuit is compiled once and reused while the support (and so the
+    CNF) is unchanged, unless pr is called with use_cached=False. With a
+    CompilationCache it is also reused across processes.
     """
 
-    def __init__(self, G):
-        self.clauses = triangle_cnf(G.num_nodes)
-        self.weights = []
-        # idea: initialize weights for edge clauses properly; but, the edge clauses aren't being tagged properly
-        # blocker: bug with how we're creating CNFs for exactly N triangles
-        raise NotImplementedError
-
-    def pr(self, G, use_cached=False):
-        # perform a WMC
-        raise NotImplementedError
+    def __init__(self, G, cache=None):
+        self.cache = cache
+        self.mgr = None
+        self.root = None
+        self.circuit = None
+        self.edges = None
+        self.edge_indices = {}
+        self.probs = []
+        self.stats = Stats()
+
+    def compile(self, G, support=None):
+        if not G.undirected:
+            raise ValueError(
+                "Triangle counting is only supported for undirected graphs."
+            )
+
+        support = triangle_support(G) if support is None else support
+        edges, self.probs, triangles, var_order = support
+        self.edges = edges
+        self.edge_indices = {}
+        for idx, (a, b) in enumerate(edges):
+            self.edge_indices[(a, b)] = idx
+            self.edge_indices[(b, a)] = idx
+        if self.cache is None:
+            self.mgr, self.root = compile_triangle_sdd(len(edges), triangles, var_order)
+            self.circuit = PolynomialCircuit(self.root, len(edges))
+            return
+
+        key = structure_key(G.num_nodes, edges, "triangles")
+        vtree_path = self.cache.get(key, "vtree")
+        sdd_path = self.cache.get(key, "sdd")
+        if vtree_path is None or sdd_path is None:
+            mgr, root = compile_triangle_sdd(len(edges), triangles, var_order)
+            self.cache.put(key, "vtree", lambda path: mgr.vtree().save(path.encode()))
+            self.cache.put(key, "sdd", lambda path: mgr.save(path.encode(), root))
+            self.mgr, self.root = mgr, root
+        else:
+            self.stats.count("cache_hits")
+            self.mgr = SddManager.from_vtree(Vtree.from_file(vtree_path.encode()))
+            self.root = self.mgr.read_sdd_file(sdd_path.encode())
+        self.circuit = PolynomialCircuit(self.root, len(edges))
+
+    def pr(self, G, use_cached=True, dense=False):
+        # the CNF only depends on the support, which a positive observation outside
+        # it also changes
+        support = triangle_support(G)
+        if not use_cached or self.circuit is None or support[0] != self.edges:
+            self.stats.count("compilations")
+            with self.stats.phase("compile"):
+                self.compile(G, support)
+        self.probs = support[1]
+
+        # adjust observed edge weights to be 1 / 0
+        pos_weights = list(self.probs)
+        neg_weights = [1 - p for p in self.probs]
+        for (s, t), pos in G.observations:
+            if (s, t) in self.edge_indices:
+                idx = self.edge_indices[(s, t)]
+                pos_weights[idx] = float(pos == 1)
+                neg_weights[idx] = float(pos == 0)
+
+        with self.stats.phase("wmc"):
+            poly = self.circuit.wmc(pos_weights, neg_weights)
+        return to_dist(dict(enumerate(poly.tolist())), 1.0, G.num_nodes, dense)
 
     def observe_edge(self, G, s, t):
-        # adjust the weight to be 1
-        raise NotImplementedError
+        return G.observe_edge(s, t)
 
     def observe_no_edge(self, G, s, t):
-        # adjust the weight to be 0
-        raise NotImplementedError
+        return G.observe_no_edge(s, t)
 
     def observe_triangle(self, G, a, b, c):
-        # call observe edge three times :)
-        raise NotImplementedError
+        return G.observe_triangle(a, b, c)
+
+
+def triangle_support(G):
+    """
+    Collects the edges of G with nonzero probability (or a positive observation)
+    and the triangles among them.
+    Returns:
+    1. a list of tuples (a, b) with a < b, ordered by their larger endpoint
+    2. the probability of each of those edges
+    3. a list of triangles, each a triple of indices into the edge list
+    4. a variable order for the vtree: each node's edges to lower-numbered nodes,
+       followed by the triangles it closes (edge i is variable i + 1, triangle j is
+       variable len(edges) + j + 1)
+    """
+    probs = {}
+    sources, targets, edge_probs = G.graph.edge_arrays()
+    for s, t, prob in zip(sources.tolist(), targets.tolist(), edge_probs.tolist()):
+        if prob > 0:
+            probs[(min(s, t), max(s, t))] = prob
+    for (s, t), pos in G.observations:
+        if pos == 1:
+            probs.setdefault((min(s, t), max(s, t)), 0.0)
+
+    edges = sorted(probs, key=lambda e: (e[1], e[0]))
+    edge_indices = {e: idx for idx, e in enumerate(edges)}
+
+    triangles = []
+    var_order = []
+    for k in range(G.num_nodes):
+        var_order.extend(
+            edge_indices[(i, k)] + 1 for i in range(k) if (i, k) in edge_indices
+        )
+        for i in range(k):
+            for j in range(i + 1, k):
+                tri = [(i, j), (j, k), (i, k)]
+                if all(e in edge_indices for e in tri):
+                    var_order.append(len(edges) + len(triangles) + 1)
+                    triangles.append([edge_indices[e] for e in tri])
+    return edges, [probs[e] for e in edges], triangles, var_order
+
+
+def compile_triangle_sdd(num_edges, triangles, var_order):
+    """
+    Compiles the conjunction of t_j <=> (e_a & e_b & e_c) over every triangle j into
+    an SDD on a balanced vtree following var_order.
+    """
+    var_count = max(num_edges + len(triangles), 1)
+    var_order = var_order or [1]
+    mgr = SddManager.from_vtree(
+        Vtree(var_count=var_count, var_order=var_order, vtree_type="balanced")
+    )
+
+    root = mgr.true()
+    for j, (a, b, c) in enumerate(triangles):
+        edges = mgr.literal(a + 1) & mgr.literal(b + 1) & mgr.literal(c + 1)
+        root = root & mgr.literal(num_edges + j + 1).equiv(edges)
+    return mgr, root
+
+
+def polynomial_wmc(root, pos_weights, neg_weights, num_edges):
+    """
+    Weighted model count of an SDD whose coefficients are indexed by the number of
+    true triangle variables (any variable past num_edges).
+    Edge variables missing from a branch contribute a factor of 1, since their two
+    weights sum to 1; triangle variables are determined by their edges, so they
+    appear in every consistent branch.
+    """
+    return PolynomialCircuit(root, num_edges).wmc(pos_weights, neg_weights)
+
+
+class PolynomialCircuit:
+    """
+    An SDD flattened into arrays for repeated polynomial_wmc queries. Decision nodes
+    are numbered by height, so each level's elements are a contiguous slice that is
+    multiplied and summed with array operations. Node polynomials are kept between
+    queries; only nodes above an edge literal whose weight changed are recomputed.
+    """
+
+    def __init__(self, root, num_edges):
+        # elements as (owner, prime, sub) node ids, each owner's elements adjacent
+        seen = {root.id}
+        leaves = []
+        owners, primes, subs = [], [], []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if not node.is_decision():
+                leaves.append(node)
+                continue
+            for prime, sub in node.elements():
+                owners.append(node.id)
+                primes.append(prime.id)
+                subs.append(sub.id)
+                for child in (prime, sub):
+                    if child.id not in seen:
+                        seen.add(child.id)
+                        stack.append(child)
+        ids = np.array(sorted(seen), dtype=np.int64)
+        owners = np.searchsorted(ids, np.array(owners, dtype=np.int64))
+        primes = np.searchsorted(ids, np.array(primes, dtype=np.int64))
+        subs = np.searchsorted(ids, np.array(subs, dtype=np.int64))
+
+        # a node's height is one more than its highest child's; leaves are at 0
+        heights = np.zeros(len(ids), dtype=np.int64)
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        while len(owners):
+            below = np.maximum(heights[primes], heights[subs])
+            updated = np.maximum.reduceat(below, starts) + 1
+            if np.array_equal(updated, heights[owners[starts]]):
+                break
+            heights[owners[starts]] = updated
+
+        # leaves come first, then decision nodes by height
+        order = np.argsort(heights, kind="stable")
+        renumber = np.empty(len(order), dtype=np.int64)
+        renumber[order] = np.arange(len(order))
+        heights = heights[order]
+        owners, primes, subs = renumber[owners], renumber[primes], renumber[subs]
+        by_owner = np.argsort(owners, kind="stable")
+        self.owners = owners[by_owner]
+        self.primes = primes[by_owner]
+        self.subs = subs[by_owner]
+
+        # (first node, last node + 1, first element, last element + 1) per level,
+        # and per node a bound on how many triangle variables it can make true
+        self.levels = []
+        self.degrees = np.zeros(len(order), dtype=np.int64)
+        leaf_index = {
+            node.id: renumber[np.searchsorted(ids, node.id)] for node in leaves
+        }
+        for node in leaves:
+            if node.is_literal() and node.literal > num_edges:
+                self.degrees[leaf_index[node.id]] = 1
+        node_bounds = np.r_[np.flatnonzero(np.diff(heights)) + 1, len(heights)]
+        elem_bounds = np.searchsorted(self.owners, node_bounds)
+        for i in range(len(node_bounds) - 1):
+            level = (
+                node_bounds[i],
+                node_bounds[i + 1],
+                elem_bounds[i],
+                elem_bounds[i + 1],
+            )
+            self.levels.append(level)
+            owners = self.owners[level[2] : level[3]]
+            starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+            products = self.degrees[self.primes[level[2] : level[3]]]
+            products = products + self.degrees[self.subs[level[2] : level[3]]]
+            self.degrees[owners[starts]] = np.maximum.reduceat(products, starts)
+
+        self.polys = np.zeros((len(order), self.degrees.max() + 1))
+        self.edge_leaves, self.edge_vars, self.positive = [], [], []
+        for node in leaves:
+            i = leaf_index[node.id]
+            if node.is_true():
+                self.polys[i, 0] = 1.0
+            elif node.is_literal():
+                var = abs(node.literal) - 1
+                if var >= num_edges:
+                    self.polys[i, int(node.literal > 0)] = 1.0
+                else:
+                    self.edge_leaves.append(i)
+                    self.edge_vars.append(var)
+                    self.positive.append(node.literal > 0)
+        self.edge_leaves = np.array(self.edge_leaves, dtype=np.int64)
+        self.edge_vars = np.array(self.edge_vars, dtype=np.int64)
+        self.positive = np.array(self.positive, dtype=bool)
+        self.root = renumber[np.searchsorted(ids, root.id)]
+        self.evaluated = False
+
+    def wmc(self, pos_weights, neg_weights):
+        """
+        Polynomial weighted model count under the given edge weights, indexed by
+        the number of true triangle variables.
+        """
+        weights = np.where(
+            self.positive,
+            np.asarray(pos_weights, dtype=float)[self.edge_vars],
+            np.asarray(neg_weights, dtype=float)[self.edge_vars],
+        )
+        dirty = np.full(len(self.polys), not self.evaluated)
+        dirty[self.edge_leaves] |= weights != self.polys[self.edge_leaves, 0]
+        self.polys[self.edge_leaves, 0] = weights
+
+        for node_lo, node_hi, elem_lo, elem_hi in self.levels:
+            owners = self.owners[elem_lo:elem_hi]
+            primes = self.primes[elem_lo:elem_hi]
+            subs = self.subs[elem_lo:elem_hi]
+            stale = np.zeros(node_hi - node_lo, dtype=bool)
+            stale[owners[dirty[primes] | dirty[subs]] - node_lo] = True
+            dirty[node_lo:node_hi] = stale
+            if not stale.any():
+                continue
+            keep = stale[owners - node_lo]
+            owners, primes, subs = owners[keep], primes[keep], subs[keep]
+            self.polys[node_lo:node_hi][stale] = 0.0
+            for start in range(0, len(owners), ELEMENT_CHUNK):
+                chunk = slice(start, start + ELEMENT_CHUNK)
+                self._add_products(owners[chunk], primes[chunk], subs[chunk])
+        self.evaluated = True
+        return self.polys[self.root, : self.degrees[self.root] + 1].copy()
+
+    # adds the product of each element's prime and sub to its owner; elements of
+    # the same owner are adjacent
+    def _add_products(self, owners, primes, subs):
+        a = self.polys[primes, : self.degrees[primes].max() + 1]
+        b = self.polys[subs, : self.degrees[subs].max() + 1]
+        if a.shape[1] < b.shape[1]:
+            a, b = b, a
+        products = np.zeros((len(owners), a.shape[1] + b.shape[1] - 1))
+        for j in range(b.shape[1]):
+            products[:, j : j + a.shape[1]] += a * b[:, j : j + 1]
+        # each element's product fits its owner's degree bound, but the chunk's
+        # widest prime and sub need not belong to the same element
+        products = products[:, : self.polys.shape[1]]
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        self.polys[owners[starts], : products.shape[1]] += np.add.reduceat(
+            products, starts, axis=0
+        )
 
 
 def ordered_edges(num_nodes):
@@ -125,12 +406,6 @@ def to_dimacs_format(clauses):
     return "\n".join(header + formatted_clauses)
 
 
-def mc(cnf):
-    mgr, root = SddManager.from_cnf_string(cnf)
-    wmc = root.wmc(log_mode=False)
-    w = wmc.propagate()
-
-
 def bench(lim):
     print("[")
     for num_nodes_step in range(2, lim):
@@ -139,15 +414,23 @@ def bench(lim):
 
         times = []
 
-        # temporarily, ignores p/q samples - these don't affect MC
-        for _ in range(25):
-            start_time = time.time()
-            dimacs_format = to_dimacs_format(triangle_cnf(num_nodes))
-            # sim: model count for each possible number of triangles
-            for _ in range(comb(num_nodes, 3)):
-                mc(dimacs_format)
-            time_elapsed = time.time() - start_time
-            times.append(time_elapsed)
+        for p_step in range(1, 6):
+            p = 0.2 * p_step
+            for q_step in range(1, 6):
+                q = 0.2 * q_step
+                start_time = time.time()
+                prob_adj_list = {n: {} for n in range(num_nodes)}
+                for source in range(num_nodes):
+                    for target in range(source + 1, num_nodes):
+                        same_block = (source < num_nodes // 2) == (
+                            target < num_nodes // 2
+                        )
+                        prob_adj_list[source][target] = p if same_block else q
+                G = SampleableRandomGraph(prob_adj_list)
+                # compiled once; the full distribution comes from one polynomial WMC
+                Propositional(G).pr(G)
+                time_elapsed = time.time() - start_time
+                times.append(time_elapsed)
 
         print(
             f'{{  "n": {num_nodes}, "mean": {str(np.mean(np.array(times)))}, "std": {str(np.std(np.array(times)))}, "times": {times} }},'
@@ -0,0 +1,94 @@
+"""
+Persistent cache of compiled models (SDDs and their vtrees, Bayesian networks) keyed
+by graph structure. Compiled artifacts only depend on which edges can exist, so a new
+process or a new probability assignment over the same support can skip compilation.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "random-graphs-pl")
+
+
+def structure_key(num_nodes, support, statistic):
+    """
+    Hashes (num_nodes, edge-support structure, statistic) into a cache key.
+    support is an iterable of undirected edges (a, b); orientation and order are ignored.
+    """
+    edges = sorted({(min(a, b), max(a, b)) for a, b in support})
+    payload = json.dumps([num_nodes, edges, statistic])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompilationCache:
+    """
+    Directory of cache entries, one subdirectory per key holding named artifacts
+    (e.g. "sdd", "vtree", "bn.pkl"). Entries are evicted least recently used first
+    once there are more than max_entries; an entry's modification time records its
+    last use.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_entries=64):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key, name):
+        return os.path.join(self.directory, key, name)
+
+    def get(self, key, name):
+        """
+        Returns the path of artifact name in the entry for key (marking the entry as
+        used), or None if it has not been stored.
+        """
+        path = self.path(key, name)
+        if not os.path.isfile(path):
+            return None
+        os.utime(os.path.dirname(path))
+        return path
+
+    def put(self, key, name, write):
+        """
+        Stores artifact name in the entry for key by calling write(path) on a staging
+        path, which is moved into place atomically so concurrent readers never see a
+        partial artifact. Returns the artifact's path.
+        """
+        os.makedirs(os.path.join(self.directory, key), exist_ok=True)
+        fd, staging = tempfile.mkstemp(
+            dir=os.path.join(self.directory, key), prefix=".staging-"
+        )
+        os.close(fd)
+        try:
+            write(staging)
+            os.replace(staging, self.path(key, name))
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+        self.evict()
+        return self.get(key, name)
+
+    def load_pickle(self, key, name):
+        path = self.get(key, name)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def store_pickle(self, key, name, obj):
+        def write(path):
+            with open(path, "wb") as f:
+                pickle.dump(obj, f)
+
+        return self.put(key, name, write)
+
+    def evict(self):
+        entries = [
+            os.path.join(self.directory, key) for key in os.listdir(self.directory)
+        ]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for path in entries[self.max_entries :]:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,220 @@
+"""
+Conditioning on edge observations when ops grow the graph after its independent
+edges are drawn. SampleableRandomGraph.sample pins observed edges among the
+initial nodes, which is exact without ops. Once ops add edges that depend on the
+sampled world, worlds that violate an observation must be reweighted instead.
+
+ParticleFilter runs sequential importance resampling over the ops. Every particle
+starts from G.sample_initial. When an op draws targets from its probs_list,
+forbidden targets are removed and the draws are conditioned to cover the required
+ones, so no particle is rejected at that step; the particle's weight is multiplied
+by the probability of the observations under the op's own distribution. Growth
+models that add many nodes at once (ops with a grow method) are weighted only by
+whether their new edges violate an observation. Particles are resampled whenever
+the effective sample size drops below resample_threshold * num_particles.
+
+This is exact when every op attaches a new node, as utils.BA and
+growth.PreferentialAttachment do, because an observed edge is then decided either
+by the independent sampling or by the op that adds its newer endpoint.
+"""
+
+import math
+import numpy as np
+from collections import Counter
+from itertools import combinations
+from profiling import Stats
+from utils import count_triangles, to_dist
+
+
+class ParticleFilter:
+    def __init__(self, num_particles=1000, resample_threshold=0.5, seed=None):
+        self.num_particles = num_particles
+        self.resample_threshold = resample_threshold
+        self.seed = seed
+        self.diagnostics = None
+        self.stats = Stats()
+
+    def pr(self, G, stat=count_triangles, use_cached=False, dense=False):
+        rng = np.random.default_rng(self.seed)
+        pinned = G.pinned_edges()
+        with self.stats.phase("initial"):
+            particles = [G.sample_initial(rng=rng) for _ in range(self.num_particles)]
+        log_weights = np.zeros(self.num_particles)
+
+        ess_trace = []
+        log_evidence = pinned_log_prob(G, pinned)
+        for op in G.ops:
+            with self.stats.phase("propagate"):
+                for i, (out_adj_list, in_adj_list) in enumerate(particles):
+                    if log_weights[i] > -math.inf:
+                        log_weights[i] += propagate(
+                            G, op, out_adj_list, in_adj_list, pinned, rng
+                        )
+
+            ess = effective_sample_size(log_weights)
+            ess_trace.append(ess)
+            if ess < self.resample_threshold * self.num_particles:
+                log_evidence += log_mean_exp(log_weights)
+                with self.stats.phase("resample"):
+                    particles = resample(particles, log_weights, rng)
+                log_weights = np.zeros(self.num_particles)
+                self.stats.count("resamples")
+
+        # required edges that no op could add are checked at the end
+        for i, (out_adj_list, _) in enumerate(particles):
+            for (s, t), present in pinned.items():
+                if present and t not in out_adj_list.get(s, ()):
+                    log_weights[i] = -math.inf
+        log_evidence += log_mean_exp(log_weights)
+        if log_evidence == -math.inf:
+            raise ValueError("Every particle violates the observations.")
+
+        weights = np.exp(log_weights - log_weights.max())
+        counts = Counter()
+        with self.stats.phase("statistic"):
+            for weight, (out_adj_list, in_adj_list) in zip(weights, particles):
+                if weight > 0:
+                    counts[stat(out_adj_list, in_adj_list)] += weight
+
+        self.diagnostics = {
+            "ess": ess_trace,
+            "final_ess": effective_sample_size(log_weights),
+            "log_evidence": log_evidence,
+        }
+        num_nodes = max(len(out_adj_list) for out_adj_list, _ in particles)
+        return to_dist(counts, weights.sum(), num_nodes, dense)
+
+    def observe_edge(self, G, s, t):
+        return G.observe_edge(s, t)
+
+    def observe_no_edge(self, G, s, t):
+        return G.observe_no_edge(s, t)
+
+    def observe_triangle(self, G, a, b, c):
+        return G.observe_triangle(a, b, c)
+
+
+# log probability of the observations that sample_initial pins
+def pinned_log_prob(G, pinned):
+    log_prob = 0.0
+    for (s, t), present in pinned.items():
+        if max(s, t) < G.num_nodes:
+            prob = G.graph.prob(s, t) if present else 1 - G.graph.prob(s, t)
+            log_prob += math.log(prob) if prob > 0 else -math.inf
+    return log_prob
+
+
+# applies op to one particle in place and returns its log incremental weight
+def propagate(G, op, out_adj_list, in_adj_list, pinned, rng):
+    log_weight = 0.0
+    if hasattr(op, "grow"):
+        sources, targets = op.grow(out_adj_list, in_adj_list, rng=rng)
+        for node in range(len(out_adj_list), len(out_adj_list) + op.num_new_nodes):
+            out_adj_list[node] = set()
+            in_adj_list[node] = set()
+        edges = list(zip(sources.tolist(), targets.tolist()))
+    else:
+        source, probs_list = op(out_adj_list, in_adj_list)
+        is_new = source not in out_adj_list
+        targets, log_weight = guided_targets(
+            G, source, probs_list, pinned, out_adj_list, is_new, rng
+        )
+        if is_new:
+            out_adj_list[source] = set()
+            in_adj_list[source] = set()
+        edges = [(source, target) for target in targets]
+
+    for source, target in edges:
+        if pinned.get(G.edge_key(source, target)) is False:
+            return -math.inf
+        G.add_edge(out_adj_list, in_adj_list, source, target)
+    return log_weight
+
+
+def guided_targets(G, source, probs_list, pinned, out_adj_list, is_new, rng):
+    """
+    Draws one target per probs in probs_list, never drawing a target whose edge to
+    source is observed absent. For a new source, the draws are also conditioned to
+    include every existing target whose edge to source is observed present, since
+    no later op can add that edge. Returns (targets, log probability of the
+    conditioning event).
+    """
+    num_targets = len(probs_list[0]) if probs_list else 0
+    forbidden = []
+    required = set()
+    for target in range(num_targets):
+        present = pinned.get(G.edge_key(source, target))
+        if present is False:
+            forbidden.append(target)
+        elif present and is_new:
+            required.add(target)
+
+    log_weight = 0.0
+    conditioned = []
+    for probs in probs_list:
+        probs = np.array(probs, dtype=np.float64)
+        probs[forbidden] = 0.0
+        mass = probs.sum()
+        if mass <= 0:
+            return [], -math.inf
+        log_weight += math.log(mass)
+        conditioned.append(probs / mass)
+
+    cover = cover_prob(conditioned, required)
+    if cover <= 0:
+        return [], -math.inf
+    log_weight += math.log(cover)
+
+    # draw i picks x with probability probs[x] * P(later draws cover what is left)
+    targets = []
+    for i, probs in enumerate(conditioned):
+        rest = conditioned[i + 1 :]
+        weights = probs * cover_prob(rest, required)
+        for target in required:
+            weights[target] = probs[target] * cover_prob(rest, required - {target})
+        target = int(rng.choice(len(weights), p=weights / weights.sum()))
+        required.discard(target)
+        targets.append(target)
+    return targets, log_weight
+
+
+# probability that independent draws from probs_list hit every target in required,
+# by inclusion-exclusion over the targets that are missed
+def cover_prob(probs_list, required):
+    total = 0.0
+    for k in range(len(required) + 1):
+        for missed in combinations(required, k):
+            term = 1.0
+            for probs in probs_list:
+                term *= 1.0 - sum(probs[target] for target in missed)
+            total += (-1) ** k * term
+    return max(total, 0.0)
+
+
+def effective_sample_size(log_weights):
+    if np.all(log_weights == -math.inf):
+        return 0.0
+    weights = np.exp(log_weights - log_weights.max())
+    return float(weights.sum() ** 2 / (weights**2).sum())
+
+
+def log_mean_exp(log_weights):
+    top = log_weights.max()
+    if top == -math.inf:
+        return -math.inf
+    return float(top + np.log(np.exp(log_weights - top).mean()))
+
+
+# systematic resampling; the chosen particles are copied so they evolve apart
+def resample(particles, log_weights, rng):
+    weights = np.exp(log_weights - log_weights.max())
+    cumulative = np.cumsum(weights / weights.sum())
+    positions = (rng.random() + np.arange(len(particles))) / len(particles)
+    chosen = np.minimum(np.searchsorted(cumulative, positions), len(particles) - 1)
+    return [
+        (
+            {node: set(nbrs) for node, nbrs in particles[i][0].items()},
+            {node: set(nbrs) for node, nbrs in particles[i][1].items()},
+        )
+        for i in chosen.tolist()
+    ]
@@ -1,91 +1,224 @@
+import itertools
+import numpy as np
+from profiling import Stats
 from random_graph import SampleableRandomGraph
 
+# number of worlds processed at a time by the vectorized bit operations
+CHUNK_SIZE = 1 << 20
+
+
 class ProbabilisticDatabase:
     def __init__(self, G):
         # set up the database and class variables
+        self.stats = Stats()
+        # observations live in the solver, not in G, so they are recorded here too
+        self.observations = []
         self.undirected = G.undirected
-        self.db = [(1, [])]
         self.n = G.num_nodes
         # From graph
-        # get all of the possible edges with their associated probability (from adjacency list)
-        db = [(1, [])]
-        edges = []
-        for src in G.out_adj_list.keys():
-            for tgt in G.out_adj_list[src].keys():
-                # if directed, add every edge
-                if not G.undirected:
-                    edges.append((src, tgt, G.out_adj_list[src][tgt]))
-                elif G.undirected and (tgt, src, G.out_adj_list[src][tgt]) not in edges:
-                    edges.append((src, tgt, G.out_adj_list[src][tgt]))
-
-        # populate the database and store the associated probabilties with each world
-        for (src, tgt, prob) in edges:
-            world_count = len(self.db)
-            for w in range(world_count):
-                (prob_og, world) = self.db[w]
-                new_world = []
-                for src_node, tgt_node in world:
-                    new_world.append((src_node, tgt_node))
-                new_world.append((src, tgt))
-                if G.undirected:
-                    new_world.append((tgt, src))
-                self.db[w] = (((1 - prob) * prob_og), world)
-                self.db.append(((prob * prob_og), new_world))
+        # get all of the possible edges with their associated probability (from adjacency list);
+        # edge e is bit e of every world's bitmask
+        self.edges = []
+        self.edge_bits = {}
+        sources, targets, probs = G.graph.edge_arrays()
+        for src, tgt, prob in zip(sources.tolist(), targets.tolist(), probs.tolist()):
+            # if directed, add every edge
+            self.edge_bits[(src, tgt)] = len(self.edges)
+            if G.undirected:
+                self.edge_bits[(tgt, src)] = len(self.edges)
+            self.edges.append((src, tgt, prob))
+
+        # populate the database: worlds are bitmasks over self.edges, with their
+        # probabilities in the parallel array self.probs; each edge doubles the
+        # array, so bit e is the high bit of the index after processing edges 0..e.
+        # self.worlds stays None (every bitmask, in order) until an observation
+        # filters it
+        self.worlds = None
+        self.probs = np.ones(1)
+        with self.stats.phase("build"):
+            for _, _, prob in self.edges:
+                self.probs = np.concatenate([self.probs * (1 - prob), self.probs * prob])
+        self.stats.count("worlds", len(self.probs))
+
+    # yields (slice, worlds) in chunks so bit tests never materialize
+    # uint64 temporaries the size of the whole database
+    def _chunks(self):
+        for start in range(0, len(self.probs), CHUNK_SIZE):
+            chunk = slice(start, start + CHUNK_SIZE)
+            if self.worlds is None:
+                stop = min(start + CHUNK_SIZE, len(self.probs))
+                yield chunk, np.arange(start, stop, dtype=np.uint64)
+            else:
+                yield chunk, self.worlds[chunk]
+
+    def _has_edge(self, s, t):
+        mask = 0
+        for key in [(s, t), (t, s)]:
+            if key in self.edge_bits:
+                mask |= 1 << self.edge_bits[key]
+        present = np.zeros(len(self.probs), dtype=bool)
+        for chunk, worlds in self._chunks():
+            present[chunk] = (worlds & np.uint64(mask)) != 0
+        return present
+
+    def pr(self, G, use_cached=False):
+        tri_totals = np.zeros(len(self.probs), dtype=np.int16)
+        # if undirected, just needs to check the one direction
+        if self.undirected:
+            masks = []
+            with self.stats.phase("masks"):
+                for i, j, k in itertools.combinations(range(self.n), 3):
+                    bits = [self.edge_bits.get(edge) for edge in [(i, j), (j, k), (i, k)]]
+                    if None not in bits:
+                        masks.append(np.uint64(sum(1 << b for b in bits)))
+            with self.stats.phase("count"):
+                for chunk, worlds in self._chunks():
+                    for mask in masks:
+                        tri_totals[chunk] += (worlds & mask) == mask
+        self.stats.count("worlds_enumerated", len(self.probs))
+
+        dist = np.bincount(tri_totals, weights=self.probs)
+        values = np.flatnonzero(np.bincount(tri_totals))
+        return dict(zip(values.tolist(), dist[values].tolist()))
+
+    def _filter(self, keep):
+        self.stats.count("worlds_filtered", int(len(keep) - keep.sum()))
+        normalize = self.probs[keep].sum()
+        if self.worlds is None:
+            self.worlds = np.flatnonzero(keep).astype(np.uint64)
+        else:
+            self.worlds = self.worlds[keep]
+        self.probs = self.probs[keep] / normalize
+
+    def observe_edge(self, G, s, t):
+        self.observations.append(((s, t), 1))
+        with self.stats.phase("filter"):
+            self._filter(self._has_edge(s, t))
+
+    def observe_no_edge(self, G, s, t):
+        self.observations.append(((s, t), 0))
+        with self.stats.phase("filter"):
+            self._filter(~self._has_edge(s, t))
+
+    def observe_triangle(self, G, a, b, c):
+        if not self.undirected:
+            raise ValueError(
+                "Triangle observations are only supported for undirected graphs."
+            )
+        self.observe_edge(G, a, b)
+        self.observe_edge(G, b, c)
+        self.observe_edge(G, a, c)
+
+
+# steps between exact recomputations of the running world probability, which
+# otherwise drifts from repeated multiply/divide by p / (1 - p)
+RESYNC_STEPS = 1 << 16
+
+
+class StreamingProbabilisticDatabase:
+    def __init__(self, G):
+        # worlds are never stored; pr enumerates them lazily in Gray-code order,
+        # so memory is O(n^2) instead of O(2^E)
+        self.stats = Stats()
+        self.undirected = G.undirected
+        self.n = G.num_nodes
+        self.edges = {}
+        sources, targets, probs = G.graph.edge_arrays()
+        for src, tgt, prob in zip(sources.tolist(), targets.tolist(), probs.tolist()):
+            self.edges[(src, tgt)] = prob
+        # observed edges are pinned and never flipped during enumeration; as in
+        # ProbabilisticDatabase, they are also recorded in self.observations
+        self.pinned = {}
+        self.observations = []
+
+    def _key(self, s, t):
+        if self.undirected and t < s:
+            return t, s
+        return s, t
 
     def pr(self, G, use_cached=False):
-        dist = {}
-        for w in range(len(self.db)):
-            world_tri_total = 0
-            (wp, world) = self.db[w]
-            for i in range(self.n):
-                # if undirected, just needs to check the one direction
-                if self.undirected:
-                    for j in range(i, self.n):
-                        if (i, j) in world:
-                            for k in range(j, self.n):
-                                if (i, k) in world and (j, k) in world:
-                                    world_tri_total += 1
-            triangle_key = f"{world_tri_total}"
-            if triangle_key in dist.keys():
-                dist[triangle_key] = dist[triangle_key] + wp
+        # start from the world with every free edge absent and pinned edges as observed
+        nbrs = [0] * self.n
+        free = []
+        for (s, t), prob in self.edges.items():
+            present = self.pinned.get((s, t))
+            if present is not None and (prob if present else 1 - prob) == 0:
+                return {}
+            if s == t:
+                # self-loops are never part of a triangle, so they only need to be
+                # consistent with their observation
+                continue
+            if present is None:
+                if prob in (0.0, 1.0):
+                    present = prob == 1.0
+                else:
+                    free.append((s, t, prob))
+                    present = False
+            if present:
+                nbrs[s] |= 1 << t
+                nbrs[t] |= 1 << s
+        for (s, t), present in self.pinned.items():
+            if (s, t) not in self.edges and present:
+                return {}
+
+        # if directed, no triangles are counted
+        if not self.undirected:
+            return {0: 1.0}
+
+        world_prob = 1.0
+        for _, _, prob in free:
+            world_prob *= 1 - prob
+        num_triangles = 0
+        for u in range(self.n):
+            for v in range(u):
+                if nbrs[u] >> v & 1:
+                    num_triangles += (nbrs[u] & nbrs[v]).bit_count()
+        num_triangles //= 3
+
+        with self.stats.phase("enumerate"):
+            dist = self._enumerate(free, nbrs, world_prob, num_triangles)
+        self.stats.count("worlds_enumerated", 2 ** len(free))
+        return dist
+
+    # visits the 2^len(free) worlds in Gray-code order from the one with no free edges
+    def _enumerate(self, free, nbrs, world_prob, num_triangles):
+        dist = {num_triangles: world_prob}
+        for step in range(1, 2 ** len(free)):
+            # flip the edge of the lowest set bit; only triangles through it change
+            s, t, prob = free[(step & -step).bit_length() - 1]
+            common = (nbrs[s] & nbrs[t]).bit_count()
+            if nbrs[s] >> t & 1:
+                nbrs[s] &= ~(1 << t)
+                nbrs[t] &= ~(1 << s)
+                num_triangles -= common
+                world_prob *= (1 - prob) / prob
             else:
-                dist[triangle_key] = wp
-        values = []
-        ret_dist = []
-        for key in dist.keys():
-            values.append(int(key))
-            ret_dist.append(dist[key])
-        return dict(zip(values, ret_dist))
+                nbrs[s] |= 1 << t
+                nbrs[t] |= 1 << s
+                num_triangles += common
+                world_prob *= prob / (1 - prob)
+
+            if step % RESYNC_STEPS == 0:
+                world_prob = 1.0
+                for u, v, p in free:
+                    world_prob *= p if nbrs[u] >> v & 1 else 1 - p
+
+            dist[num_triangles] = dist.get(num_triangles, 0.0) + world_prob
+        return dist
 
     def observe_edge(self, G, s, t):
-        normalize = 0
-        updated_db = []
-        for w in range(len(self.db)):
-            (wp, world) = self.db[w]
-            if ((s, t) in world) or ((t, s) in world):
-                normalize += wp
-                updated_db.append((wp, world))
-        self.db = []
-        for wp, world in updated_db:
-            self.db.append(((wp / normalize), world))
+        self.observations.append(((s, t), 1))
+        self.pinned[self._key(s, t)] = True
 
     def observe_no_edge(self, G, s, t):
-        normalize = 0
-        updated_db = []
-        for w in range(len(self.db)):
-            (wp, world) = self.db[w]
-            if ((s, t) not in world) and ((t, s) not in world):
-                normalize += wp
-                updated_db.append((wp, world))
-        self.db = []
-        for wp, world in updated_db:
-            self.db.append(((wp / normalize), world))
+        self.observations.append(((s, t), 0))
+        self.pinned[self._key(s, t)] = False
 
     def observe_triangle(self, G, a, b, c):
         if not self.undirected:
-            return ValueError(
+            raise ValueError(
                 "Triangle observations are only supported for undirected graphs."
             )
         self.observe_edge(G, a, b)
         self.observe_edge(G, b, c)
-        self.observe_edge(G, a, c)
\ No newline at end of file
+        self.observe_edge(G, a, c)
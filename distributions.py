@@ -0,0 +1,213 @@
+"""
+Algebra on count distributions, sparse dicts {count: probability}, and a solver
+that uses it to split triangle counting into independent pieces.
+
+The triangle count of a graph with independent edges is the sum of the counts of
+its triangle groups: classes of edges where two edges are in the same class when
+they share a triangle. Edges in different groups are independent, and every
+triangle lies inside one group, so the distribution is the convolution of the
+per-group distributions. Groups refine connected components: a hub with many
+edge-disjoint triangles splits into single triangles, and edges on no triangle
+drop out entirely.
+
+convolve picks a sparse, direct or FFT product depending on the supports' sizes.
+"""
+
+import heapq
+import numpy as np
+from collections import Counter
+from database import StreamingProbabilisticDatabase
+from graph import CSRGraph
+from elimination import (
+    MAX_BAG_EDGES,
+    BucketElimination,
+    bag_edge_counts,
+    edge_support,
+    elimination_bags,
+)
+from profiling import Stats
+from random_graph import SampleableRandomGraph
+from utils import to_dist
+
+# supports whose product has at most this many terms are convolved as dicts
+SPARSE_TERMS = 1 << 12
+# dense arrays this long or longer (both of them) are convolved by FFT
+FFT_MIN_LENGTH = 64
+# groups with at most this many edges are solved by enumerating their worlds
+ENUMERATE_EDGES = 12
+
+
+def to_array(dist):
+    array = np.zeros(max(dist, default=-1) + 1)
+    for count, prob in dist.items():
+        array[count] = prob
+    return array
+
+
+def from_array(array):
+    values = np.flatnonzero(array > 0)
+    return dict(zip(values.tolist(), array[values].tolist()))
+
+
+def convolve(a, b):
+    """
+    Distribution of X + Y for independent X ~ a and Y ~ b.
+    """
+    if len(a) * len(b) <= SPARSE_TERMS:
+        dist = {}
+        for x, p in a.items():
+            for y, q in b.items():
+                dist[x + y] = dist.get(x + y, 0.0) + p * q
+        return dist
+
+    a, b = to_array(a), to_array(b)
+    if min(len(a), len(b)) < FFT_MIN_LENGTH:
+        return from_array(np.convolve(a, b))
+    n = len(a) + len(b) - 1
+    array = np.fft.irfft(np.fft.rfft(a, n) * np.fft.rfft(b, n), n)
+    # FFT round-off leaves tiny nonzero values where the exact product is zero
+    array[array < 1e-15 * array.max()] = 0.0
+    return from_array(array)
+
+
+def convolve_all(dists):
+    """
+    Convolution of any number of distributions, smallest supports first so the
+    intermediate results stay small; the empty convolution is {0: 1.0}.
+    """
+    heap = [(len(dist), i, dist) for i, dist in enumerate(dists)]
+    heapq.heapify(heap)
+    if not heap:
+        return {0: 1.0}
+    while len(heap) > 1:
+        _, i, a = heapq.heappop(heap)
+        _, _, b = heapq.heappop(heap)
+        dist = convolve(a, b)
+        heapq.heappush(heap, (len(dist), i, dist))
+    return heap[0][2]
+
+
+def triangle_groups(edges):
+    """
+    Partitions the edges that lie on a triangle, given as sorted pairs u < v, into
+    classes connected by shared triangles. Returns lists of edge indices.
+    """
+    edge_ids = {edge: idx for idx, edge in enumerate(edges)}
+    later = {}
+    for u, v in edges:
+        later.setdefault(u, set()).add(v)
+
+    parent = list(range(len(edges)))
+
+    def find(e):
+        while parent[e] != e:
+            parent[e] = parent[parent[e]]
+            e = parent[e]
+        return e
+
+    on_triangle = set()
+    for (u, v), uv in edge_ids.items():
+        for w in later.get(u, set()) & later.get(v, set()):
+            tri = [uv, edge_ids[(u, w)], edge_ids[(v, w)]]
+            on_triangle.update(tri)
+            root = find(tri[0])
+            for e in tri[1:]:
+                parent[find(e)] = root
+
+    groups = {}
+    for e in sorted(on_triangle):
+        groups.setdefault(find(e), []).append(e)
+    return list(groups.values())
+
+
+class Decomposition:
+    def __init__(
+        self,
+        max_enumerate_edges=ENUMERATE_EDGES,
+        max_bag_edges=MAX_BAG_EDGES,
+        fallback=None,
+    ):
+        # each triangle group is solved by enumeration if it has at most
+        # max_enumerate_edges edges, else by bucket elimination if its bags fit in
+        # max_bag_edges, else by fallback (a sampling solver such as MonteCarlo)
+        self.max_enumerate_edges = max_enumerate_edges
+        self.max_bag_edges = max_bag_edges
+        self.fallback = fallback
+        self.support = None
+        self.groups = None
+        self.diagnostics = None
+        self.stats = Stats()
+
+    def pr(self, G, use_cached=False, dense=False):
+        if not G.undirected:
+            raise ValueError(
+                "Triangle counting is only supported for undirected graphs."
+            )
+        if G.ops:
+            raise ValueError("Decomposition does not support ops.")
+
+        # observations condition single edges, so they only change probabilities
+        edges, weights, scale = edge_support(G)
+        if scale == 0 or any(sum(w) == 0 for w in weights):
+            return {}
+        probs = [present / (absent + present) for absent, present in weights]
+
+        # the groups only depend on the support
+        if not use_cached or self.groups is None or edges != self.support:
+            with self.stats.phase("decompose"):
+                self.groups = triangle_groups(edges)
+            self.support = edges
+
+        backends = Counter()
+        dists = []
+        with self.stats.phase("solve"):
+            for group in self.groups:
+                dist, backend = self._solve(edges, probs, group)
+                dists.append(dist)
+                backends[backend] += 1
+        with self.stats.phase("convolve"):
+            dist = convolve_all(dists)
+        self.stats.count("groups", len(self.groups))
+
+        self.diagnostics = {
+            "num_groups": len(self.groups),
+            "largest_group": max(map(len, self.groups), default=0),
+            "backends": dict(backends),
+        }
+        return to_dist(dist, sum(dist.values()), G.num_nodes, dense)
+
+    # solves one group on its own graph, relabeled to 0..k-1; returns (distribution,
+    # name of the backend used)
+    def _solve(self, edges, probs, group):
+        nodes = sorted({u for e in group for u in edges[e]})
+        index = {u: i for i, u in enumerate(nodes)}
+        local = [(index[edges[e][0]], index[edges[e][1]]) for e in group]
+        graph = CSRGraph.from_edges(
+            len(nodes),
+            [u for u, _ in local],
+            [v for _, v in local],
+            [probs[e] for e in group],
+        )
+        G = SampleableRandomGraph(graph)
+
+        if len(group) <= self.max_enumerate_edges:
+            return StreamingProbabilisticDatabase(G).pr(G), "streaming"
+        bags = elimination_bags(len(nodes), sorted(local))
+        if max(bag_edge_counts(bags, sorted(local))) <= self.max_bag_edges:
+            solver = BucketElimination(self.max_bag_edges)
+            return solver.pr(G), "elimination"
+        if self.fallback is None:
+            raise ValueError(
+                f"A triangle group with {len(group)} edges is too dense for the "
+                "exact backends and no fallback solver was given."
+            )
+        return self.fallback.pr(G), type(self.fallback).__name__
+
+    def observe_edge(self, G, s, t):
+        return G.observe_edge(s, t)
+
+    def observe_no_edge(self, G, s, t):
+        return G.observe_no_edge(s, t)
+
+    def observe_triangle(self, G, a, b, c):
+        return G.observe_triangle(a, b, c)
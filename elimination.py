@@ -0,0 +1,253 @@
+"""
+Exact triangle-count distributions by bucket elimination over the vertices of the
+support graph, for sparse graphs whose support has low treewidth.
+
+Every edge of the support is a binary variable. Vertices are eliminated in a
+greedy min-fill order, which defines a tree decomposition: the bag of vertex v is
+v together with its neighbors at elimination time. Eliminating v multiplies the
+prior of every edge at v with the factors in v's bucket, counts the triangles that
+contain v (each triangle is counted at its first eliminated vertex), and sums the
+edges at v out. The result is a factor over the edges among v's neighbors, which
+goes to the bucket of the first of them to be eliminated.
+
+Factor values are polynomials in a formal variable x, stored along the last axis
+of the table, so the coefficient of x^t is the probability of t triangles. A bag
+with k vertices holds at most k(k - 1) / 2 edge variables, so the cost grows as
+2^(w(w + 1) / 2) in the width w of the order and linearly in the number of bags.
+"""
+
+import itertools
+import numpy as np
+from profiling import Stats
+from utils import to_dist
+
+# bags may hold at most this many edge variables; a factor over them has
+# 2^MAX_BAG_EDGES entries per triangle count
+MAX_BAG_EDGES = 20
+
+
+class BucketElimination:
+    def __init__(self, max_bag_edges=MAX_BAG_EDGES):
+        self.max_bag_edges = max_bag_edges
+        self.support = None
+        self.bags = None
+        self.width = None
+        self.stats = Stats()
+
+    def pr(self, G, use_cached=False, dense=False):
+        if not G.undirected:
+            raise ValueError(
+                "Triangle counting is only supported for undirected graphs."
+            )
+        if G.ops:
+            raise ValueError("Bucket elimination does not support ops.")
+
+        edges, weights, scale = edge_support(G)
+        # the elimination order only depends on the support
+        if not use_cached or self.bags is None or edges != self.support:
+            with self.stats.phase("order"):
+                self.bags = elimination_bags(G.num_nodes, edges)
+            self.support = edges
+            self.width = max((len(nbrs) for _, nbrs in self.bags), default=0)
+            self.stats.count("orderings")
+
+        with self.stats.phase("eliminate"):
+            poly = scale * self._eliminate(edges, weights)
+        # observations condition the distribution, so the result is normalized by
+        # their probability (and is empty if they are impossible)
+        total = poly.sum()
+        if total == 0:
+            return {}
+        return to_dist(dict(enumerate(poly.tolist())), total, G.num_nodes, dense)
+
+    def _eliminate(self, edges, weights):
+        edge_ids = {edge: idx for idx, edge in enumerate(edges)}
+        position = {v: pos for pos, (v, _) in enumerate(self.bags)}
+        buckets = {v: [] for v, _ in self.bags}
+        result = np.ones(1)
+
+        for v, nbrs in self.bags:
+            # edges at v that are summed out here, then every edge among nbrs that
+            # a triangle at v or a factor in the bucket mentions
+            local = [edge_ids[key(v, u)] for u in nbrs if key(v, u) in edge_ids]
+            triangles = []
+            for i, u in enumerate(nbrs):
+                for w in nbrs[i + 1 :]:
+                    tri = [key(v, u), key(v, w), key(u, w)]
+                    if all(edge in edge_ids for edge in tri):
+                        triangles.append([edge_ids[edge] for edge in tri])
+            kept = {e for tri in triangles for e in tri[2:]}
+            for scope, _ in buckets[v]:
+                kept.update(e for e in scope if e not in local)
+            scope = sorted(kept) + sorted(local)
+            if len(scope) > self.max_bag_edges:
+                raise ValueError(
+                    f"A bag has {len(scope)} edge variables, more than "
+                    f"max_bag_edges = {self.max_bag_edges}; the support's "
+                    "treewidth is too large for exact elimination."
+                )
+
+            # the local terms have low degree, so they are combined before the
+            # factors from the bucket, whose degrees grow with the eliminated graph
+            table = np.ones((1,) * len(scope) + (1,))
+            for e in local:
+                prior = np.array(weights[e])[:, None]
+                table = table * expand(prior, [e], scope)
+            table = shift(table, triangle_counts(triangles, scope))
+            for factor_scope, factor in buckets.pop(v):
+                table = poly_mul(table, expand(factor, factor_scope, scope))
+            self.stats.count("bags")
+
+            # sum out the edges at v, which are the trailing axes of the scope, and
+            # drop counts whose probability underflowed to zero
+            table = table.sum(axis=tuple(range(len(kept), len(scope))))
+            nonzero = np.flatnonzero(table.reshape(-1, table.shape[-1]).any(axis=0))
+            table = table[..., : nonzero[-1] + 1 if len(nonzero) else 1]
+            scope = scope[: len(kept)]
+            if not scope:
+                result = poly_mul(result, table)
+                continue
+            first = min((u for e in scope for u in edges[e]), key=position.get)
+            buckets[first].append((scope, table))
+        return result
+
+    def observe_edge(self, G, s, t):
+        return G.observe_edge(s, t)
+
+    def observe_no_edge(self, G, s, t):
+        return G.observe_no_edge(s, t)
+
+    def observe_triangle(self, G, a, b, c):
+        return G.observe_triangle(a, b, c)
+
+
+def key(u, v):
+    return (u, v) if u < v else (v, u)
+
+
+def edge_support(G):
+    """
+    The edges that can be present, as sorted pairs u < v, with their (absent,
+    present) weights: the edge probabilities, with the state an observation rules
+    out set to 0. Edges that are absent in every consistent world are left out,
+    and the product of their absent weights is returned as a scale.
+    """
+    sources, targets, probs = G.edge_arrays()
+    pinned = G.pinned_edges()
+    support = {}
+    scale = 1.0
+    for s, t, prob in zip(sources.tolist(), targets.tolist(), probs.tolist()):
+        weights = (1 - prob, prob)
+        observed = pinned.get(G.edge_key(s, t))
+        if observed is not None:
+            weights = (0.0, prob) if observed else (1 - prob, 0.0)
+        if s == t:
+            # self-loops are never part of a triangle
+            scale *= sum(weights)
+        elif weights[1] > 0:
+            support[key(s, t)] = weights
+        else:
+            scale *= weights[0]
+    edges = sorted(support)
+    return edges, [support[edge] for edge in edges], scale
+
+
+def elimination_bags(num_nodes, edges):
+    """
+    Greedy min-fill elimination order (ties broken by degree) over the graph with
+    the given edges. Returns the bags as (vertex, sorted later neighbors) pairs in
+    elimination order.
+    """
+    nbrs = [set() for _ in range(num_nodes)]
+    for u, v in edges:
+        nbrs[u].add(v)
+        nbrs[v].add(u)
+
+    def score(v):
+        fill = 0
+        for u in nbrs[v]:
+            fill += len(nbrs[v] - nbrs[u]) - 1
+        return fill // 2, len(nbrs[v])
+
+    scores = {v: score(v) for v in range(num_nodes)}
+    bags = []
+    while scores:
+        v = min(scores, key=scores.get)
+        del scores[v]
+        later = nbrs[v]
+        bags.append((v, sorted(later)))
+        # connect the neighbors into a clique and drop v
+        for u in later:
+            nbrs[u].discard(v)
+            nbrs[u].update(later - {u})
+        nbrs[v] = set()
+        # only scores within distance two of v can change
+        affected = set(later)
+        for u in later:
+            affected.update(nbrs[u])
+        for u in affected:
+            scores[u] = score(u)
+    return bags
+
+
+# upper bound on the number of edge variables in each bag: the support edges among
+# the bag's vertices
+def bag_edge_counts(bags, edges):
+    support = set(edges)
+    counts = []
+    for v, nbrs in bags:
+        vertices = [v] + nbrs
+        counts.append(
+            sum(key(a, b) in support for a, b in itertools.combinations(vertices, 2))
+        )
+    return counts
+
+
+# reshapes a factor over scope (a sorted subset of full_scope, with a trailing
+# polynomial axis) so it broadcasts against tables over full_scope
+def expand(table, scope, full_scope):
+    positions = {e: i for i, e in enumerate(full_scope)}
+    order = np.argsort([positions[e] for e in scope], kind="stable")
+    table = np.transpose(table, list(order) + [len(scope)])
+    shape = [1] * len(full_scope) + [table.shape[-1]]
+    for e in scope:
+        shape[positions[e]] = 2
+    return table.reshape(shape)
+
+
+# product of two tables of polynomials along the last axis
+def poly_mul(a, b):
+    if a.shape[-1] < b.shape[-1]:
+        a, b = b, a
+    shape = np.broadcast_shapes(a.shape[:-1], b.shape[:-1])
+    out = np.zeros(shape + (a.shape[-1] + b.shape[-1] - 1,))
+    for j in range(b.shape[-1]):
+        out[..., j : j + a.shape[-1]] += a * b[..., j : j + 1]
+    return out
+
+
+# number of the given triangles present in every assignment to scope
+def triangle_counts(triangles, scope):
+    positions = {e: i for i, e in enumerate(scope)}
+    counts = np.zeros((1,) * len(scope), dtype=np.int64)
+    for tri in triangles:
+        present = np.ones((1,) * len(scope), dtype=np.int64)
+        for e in tri:
+            shape = [1] * len(scope)
+            shape[positions[e]] = 2
+            present = present * np.arange(2).reshape(shape)
+        counts = counts + present
+    return counts
+
+
+# multiplies every polynomial in table by x^counts
+def shift(table, counts):
+    top = int(counts.max())
+    if top == 0:
+        return table
+    shape = np.broadcast_shapes(table.shape[:-1], counts.shape)
+    degrees = table.shape[-1]
+    table = np.broadcast_to(table, shape + (degrees,))
+    out = np.zeros(shape + (degrees + top,))
+    np.put_along_axis(out, counts[..., None] + np.arange(degrees), table, axis=-1)
+    return out
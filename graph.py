@@ -0,0 +1,132 @@
+"""
+Compact graph core shared by the solvers: the potential edges of a random graph in
+CSR form, with int32 row pointers and column indices and a float32 probability per
+edge. An undirected edge is stored once, in the row of its smaller endpoint, so
+edge e has a single probability and every solver sees the same edge order.
+"""
+
+import numpy as np
+import torch
+
+
+class CSRGraph:
+    def __init__(self, num_nodes, indptr, indices, probs, undirected=True):
+        self.num_nodes = num_nodes
+        self.indptr = np.asarray(indptr, dtype=np.int32)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.probs = np.asarray(probs, dtype=np.float32)
+        self.undirected = undirected
+
+    @classmethod
+    def from_edges(cls, num_nodes, sources, targets, probs, undirected=True):
+        """
+        Builds the graph from parallel edge arrays. Undirected edges may come in
+        either orientation; for duplicate edges the first probability is kept.
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        probs = np.asarray(probs, dtype=np.float32)
+        if undirected:
+            sources, targets = (
+                np.minimum(sources, targets),
+                np.maximum(sources, targets),
+            )
+
+        keys = sources * num_nodes + targets
+        _, first = np.unique(keys, return_index=True)
+        sources, targets, probs = sources[first], targets[first], probs[first]
+
+        indptr = np.zeros(num_nodes + 1, dtype=np.int32)
+        np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+        return cls(num_nodes, indptr, targets, probs, undirected)
+
+    @classmethod
+    def from_adj_list(cls, out_adj_list, undirected=True):
+        # source : {target : prob}, the SampleableRandomGraph format
+        sources, targets, probs = [], [], []
+        for source in out_adj_list:
+            for target, prob in out_adj_list[source].items():
+                sources.append(source)
+                targets.append(target)
+                probs.append(prob)
+        return cls.from_edges(len(out_adj_list), sources, targets, probs, undirected)
+
+    @classmethod
+    def from_scipy(cls, matrix, undirected=True):
+        matrix = matrix.tocoo()
+        return cls.from_edges(
+            matrix.shape[0], matrix.row, matrix.col, matrix.data, undirected
+        )
+
+    @classmethod
+    def from_edge_index(cls, edge_index, num_nodes, probs=None, undirected=True):
+        sources, targets = edge_index.numpy()
+        if probs is None:
+            probs = np.ones(len(sources), dtype=np.float32)
+        return cls.from_edges(num_nodes, sources, targets, probs, undirected)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    # row of every edge, the expanded form of indptr
+    def sources(self):
+        return np.repeat(
+            np.arange(self.num_nodes, dtype=np.int32), np.diff(self.indptr)
+        )
+
+    # (sources, targets, probs) in edge order; targets and probs are views
+    def edge_arrays(self):
+        return self.sources(), self.indices, self.probs
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node] : self.indptr[node + 1]]
+
+    def edge_id(self, s, t):
+        """
+        Position of edge (s, t) in edge order, or None if it is not a potential edge.
+        """
+        if self.undirected and t < s:
+            s, t = t, s
+        start, end = self.indptr[s], self.indptr[s + 1]
+        pos = start + np.searchsorted(self.indices[start:end], t)
+        if pos < end and self.indices[pos] == t:
+            return int(pos)
+        return None
+
+    def prob(self, s, t):
+        pos = self.edge_id(s, t)
+        return 0.0 if pos is None else float(self.probs[pos])
+
+    def edge_index(self):
+        """
+        torch edge_index over the support. Undirected graphs get both orientations,
+        as torch_geometric expects.
+        """
+        sources = torch.from_numpy(self.sources())
+        targets = torch.from_numpy(self.indices)
+        if self.undirected:
+            sources, targets = torch.cat([sources, targets]), torch.cat(
+                [targets, sources]
+            )
+        return torch.stack([sources, targets]).long()
+
+    def to_scipy(self):
+        """
+        SciPy CSR matrix of edge probabilities that shares this graph's arrays
+        (upper triangular for undirected graphs).
+        """
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix(
+            (self.probs, self.indices, self.indptr),
+            shape=(self.num_nodes, self.num_nodes),
+            copy=False,
+        )
+
+    def to_adj_list(self):
+        out_adj_list = {node: {} for node in range(self.num_nodes)}
+        sources, targets, probs = self.edge_arrays()
+        for s, t, prob in zip(sources.tolist(), targets.tolist(), probs.tolist()):
+            out_adj_list[s][t] = prob
+        return out_adj_list
@@ -0,0 +1,173 @@
+"""
+Registry of graph statistics. Every statistic has a per-world implementation over
+(out_adj_list, in_adj_list), which is what SampleableRandomGraph.sample passes to
+a stat, and a vectorized one over a (num_samples, num_nodes, num_nodes) boolean
+adjacency stack, which is what SampleableRandomGraph.to_adjacency returns. All
+statistics assume the graph is undirected, and their values are hashable so they
+can be histogrammed.
+"""
+
+from collections import deque
+from functools import partial
+import numpy as np
+
+from utils import count_triangles, count_triangles_batch
+
+
+class Statistic:
+    def __init__(self, name, per_world, batched):
+        self.name = name
+        self.per_world = per_world
+        self.batched = batched
+
+    def __call__(self, out_adj_list, in_adj_list):
+        return self.per_world(out_adj_list, in_adj_list)
+
+
+STATISTICS = {}
+
+
+def register(name, per_world, batched):
+    STATISTICS[name] = Statistic(name, per_world, batched)
+    return STATISTICS[name]
+
+
+def get_statistic(stat):
+    """
+    Resolves a registered name, a Statistic, or a per-world function that was
+    registered (e.g. utils.count_triangles) to its Statistic, or None.
+    """
+    if isinstance(stat, Statistic):
+        return stat
+    if isinstance(stat, str):
+        return STATISTICS[stat]
+    for statistic in STATISTICS.values():
+        if statistic.per_world is stat:
+            return statistic
+    return None
+
+
+def degrees(out_adj_list):
+    return np.array([len(out_adj_list[n]) for n in range(len(out_adj_list))])
+
+
+def count_wedges(out_adj_list, in_adj_list):
+    deg = degrees(out_adj_list)
+    return int((deg * (deg - 1) // 2).sum())
+
+
+def count_wedges_batch(adj):
+    deg = adj.sum(axis=2)
+    return (deg * (deg - 1) // 2).sum(axis=1)
+
+
+def degree_histogram(out_adj_list, in_adj_list):
+    num_nodes = len(out_adj_list)
+    return tuple(np.bincount(degrees(out_adj_list), minlength=num_nodes).tolist())
+
+
+def degree_histogram_batch(adj):
+    num_nodes = adj.shape[1]
+    deg = adj.sum(axis=2)
+    hist = (deg[:, :, None] == np.arange(num_nodes)).sum(axis=1)
+    return [tuple(row) for row in hist.tolist()]
+
+
+# global clustering coefficient (transitivity): 3 * triangles / wedges
+def clustering_coefficient(out_adj_list, in_adj_list):
+    wedges = count_wedges(out_adj_list, in_adj_list)
+    if wedges == 0:
+        return 0.0
+    return 3 * count_triangles(out_adj_list, in_adj_list) / wedges
+
+
+def clustering_coefficient_batch(adj):
+    wedges = count_wedges_batch(adj)
+    triangles = count_triangles_batch(adj)
+    return np.divide(
+        3 * triangles,
+        wedges,
+        out=np.zeros(len(wedges), dtype=np.float64),
+        where=wedges > 0,
+    )
+
+
+def count_components(out_adj_list, in_adj_list):
+    seen = set()
+    num_components = 0
+    for source in range(len(out_adj_list)):
+        if source in seen:
+            continue
+        num_components += 1
+        seen.add(source)
+        frontier = deque([source])
+        while frontier:
+            node = frontier.popleft()
+            for target in out_adj_list[node]:
+                if target not in seen:
+                    seen.add(target)
+                    frontier.append(target)
+    return num_components
+
+
+# reachability by repeated squaring of (A + I); every component of size s
+# contributes s nodes that each reach exactly s nodes
+def count_components_batch(adj):
+    num_samples, num_nodes, _ = adj.shape
+    if num_nodes == 0:
+        return np.zeros(num_samples, dtype=np.int64)
+    reach = adj | np.eye(num_nodes, dtype=bool)
+    for _ in range(max(num_nodes - 1, 1).bit_length()):
+        R = reach.astype(np.float32)
+        reach = np.matmul(R, R) > 0
+    return (1 / reach.sum(axis=2)).sum(axis=1).round().astype(np.int64)
+
+
+def count_cliques(out_adj_list, in_adj_list, k=4):
+    higher = {n: {m for m in out_adj_list[n] if m > n} for n in out_adj_list}
+
+    def extend(candidates, depth):
+        if depth == 0:
+            return 1
+        return sum(extend(candidates & higher[v], depth - 1) for v in candidates)
+
+    return extend(set(higher), k)
+
+
+# grows cliques in node order with a per-world candidate mask; the last three
+# nodes are counted at once as triangles inside the mask
+def count_cliques_batch(adj, k=4):
+    num_samples, num_nodes, _ = adj.shape
+    higher = adj & np.triu(np.ones((num_nodes, num_nodes), dtype=bool), 1)
+
+    def extend(mask, depth):
+        if depth == 1:
+            return mask.sum(axis=1)
+        if depth == 2:
+            m = mask.astype(np.float32)
+            return np.einsum("bv,bvw,bw->b", m, higher.astype(np.float32), m)
+        if depth == 3:
+            return count_triangles_batch(adj & mask[:, :, None] & mask[:, None, :])
+        total = np.zeros(num_samples)
+        for v in range(num_nodes):
+            total += extend(mask & higher[:, v, :] & mask[:, v, None], depth - 1)
+        return total
+
+    mask = np.ones((num_samples, num_nodes), dtype=bool)
+    return np.asarray(extend(mask, k)).round().astype(np.int64)
+
+
+def register_cliques(k):
+    return register(
+        f"{k}-cliques",
+        partial(count_cliques, k=k),
+        partial(count_cliques_batch, k=k),
+    )
+
+
+register("triangles", count_triangles, count_triangles_batch)
+register("wedges", count_wedges, count_wedges_batch)
+register("degree_histogram", degree_histogram, degree_histogram_batch)
+register("clustering", clustering_coefficient, clustering_coefficient_batch)
+register("components", count_components, count_components_batch)
+register_cliques(4)
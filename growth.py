@@ -0,0 +1,277 @@
+"""
+Growth models that add nodes one at a time and attach each one to existing nodes,
+such as Barabasi-Albert preferential attachment. This replaces operating with
+utils.BA, which rebuilds the full degree and probability vectors for every new
+node.
+
+Attachment proportional to degree (plus an optional offset) draws from a list that
+holds every node once per incident edge end, so each attachment is O(1). Other
+weightings, such as a power of the degree, use a Fenwick tree over the node
+weights, so each attachment and each degree update is O(log n).
+"""
+
+from array import array
+import numpy as np
+
+# uniforms are drawn from the generator at most this many at a time
+UNIFORM_CHUNK = 1 << 16
+
+
+class FenwickTree:
+    # prefix sums over non-negative weights of nodes 0..capacity-1
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.tree = [0.0] * (capacity + 1)
+        self.total = 0.0
+        self.top = 1 << (capacity.bit_length() - 1) if capacity else 0
+
+    def add(self, index, delta):
+        self.total += delta
+        index += 1
+        while index <= self.capacity:
+            self.tree[index] += delta
+            index += index & -index
+
+    # the node whose weight interval contains value, for 0 <= value < total
+    def find(self, value):
+        pos = 0
+        step = self.top
+        while step:
+            nxt = pos + step
+            if nxt <= self.capacity and self.tree[nxt] <= value:
+                pos = nxt
+                value -= self.tree[nxt]
+            step >>= 1
+        return min(pos, self.capacity - 1)
+
+
+# draws nodes with probability proportional to degree + offset: from the
+# repeated-nodes list with probability sum(degrees) / total weight, else uniformly
+class RepeatedNodes:
+    def __init__(self, degrees, capacity, offset=0.0):
+        self.offset = offset
+        self.nodes = array("q")
+        self.active = bytearray(capacity)
+        for node, degree in enumerate(degrees):
+            self.nodes.extend([node] * degree)
+            self.active[node] = 1 if degree > 0 else 0
+        self.num_nodes = len(degrees)
+        self.num_candidates = sum(self.active)
+
+    def draw(self, u):
+        if not self.nodes:
+            return int(u * self.num_nodes)
+        x = u * (len(self.nodes) + self.offset * self.num_nodes)
+        if x < len(self.nodes):
+            return self.nodes[int(x)]
+        return min(int((x - len(self.nodes)) / self.offset), self.num_nodes - 1)
+
+    def attach(self, source, targets):
+        for node in targets + [source]:
+            if not self.active[node] and targets:
+                self.active[node] = 1
+                self.num_candidates += 1
+        self.nodes.extend(targets)
+        self.nodes.extend([source] * len(targets))
+        self.num_nodes += 1
+
+    def candidates(self):
+        if not self.nodes or self.offset > 0:
+            return self.num_nodes
+        return self.num_candidates
+
+
+# draws nodes with probability proportional to (degree + offset) ** exponent
+class WeightedNodes:
+    def __init__(self, degrees, capacity, offset=0.0, exponent=1.0):
+        self.offset = offset
+        self.exponent = exponent
+        self.tree = FenwickTree(capacity)
+        self.degrees = list(degrees)
+        for node, degree in enumerate(self.degrees):
+            self.tree.add(node, self.weight(degree))
+        self.num_candidates = sum(self.weight(d) > 0 for d in self.degrees)
+
+    # every degree passes through here, so a negative offset is checked against
+    # the initial degrees up front and against each new node as it is added
+    def weight(self, degree):
+        if degree + self.offset < 0:
+            raise ValueError(
+                f"offset = {self.offset} gives a node of degree {degree} a negative "
+                "weight; offset must be at least minus every node's degree."
+            )
+        return (degree + self.offset) ** self.exponent
+
+    def draw(self, u):
+        if self.tree.total <= 0:
+            return int(u * len(self.degrees))
+        return self.tree.find(u * self.tree.total)
+
+    def attach(self, source, targets):
+        for target in targets:
+            degree = self.degrees[target]
+            if self.weight(degree) <= 0 < self.weight(degree + 1):
+                self.num_candidates += 1
+            self.tree.add(target, self.weight(degree + 1) - self.weight(degree))
+            self.degrees[target] = degree + 1
+        self.degrees.append(len(targets))
+        self.tree.add(source, self.weight(len(targets)))
+        self.num_candidates += self.weight(len(targets)) > 0
+
+    def candidates(self):
+        return self.num_candidates if self.tree.total > 0 else len(self.degrees)
+
+
+# yields uniforms drawn size at a time (capped at UNIFORM_CHUNK), so a caller that
+# needs about size of them draws no more than that from rng
+def iter_uniforms(rng, size=UNIFORM_CHUNK):
+    size = max(1, min(size, UNIFORM_CHUNK))
+    while True:
+        yield from rng.random(size).tolist()
+
+
+def attach(
+    degrees, num_new_nodes, m=2, rng=None, offset=0.0, exponent=1.0, uniforms=None
+):
+    """
+    Adds num_new_nodes nodes, numbered from len(degrees), to a graph with the given
+    node degrees. Each new node is attached to m distinct earlier nodes (fewer if
+    fewer can be drawn), chosen with probability proportional to
+    (degree + offset) ** exponent; while every weight is zero, nodes are chosen
+    uniformly. Draws come from uniforms, an iterator from iter_uniforms, or from a
+    new one over rng sized to the attachments. Returns the new edges as (sources,
+    targets) arrays.
+    """
+    if uniforms is None:
+        rng = np.random.default_rng() if rng is None else rng
+        uniforms = iter_uniforms(rng, num_new_nodes * m)
+    degrees = np.asarray(degrees, dtype=np.int64)
+    capacity = len(degrees) + num_new_nodes
+    if exponent == 1 and offset >= 0:
+        sampler = RepeatedNodes(degrees, capacity, offset)
+    else:
+        sampler = WeightedNodes(degrees.tolist(), capacity, offset, exponent)
+
+    sources = array("q")
+    targets = array("q")
+    for source in range(len(degrees), capacity):
+        num_targets = min(m, sampler.candidates())
+        chosen = []
+        while len(chosen) < num_targets:
+            target = sampler.draw(next(uniforms))
+            if target not in chosen:
+                chosen.append(target)
+
+        sampler.attach(source, chosen)
+        sources.extend([source] * len(chosen))
+        targets.extend(chosen)
+
+    return np.frombuffer(sources, dtype=np.int64), np.frombuffer(
+        targets, dtype=np.int64
+    )
+
+
+# nodes 0..m-1 with node m attached to all of them, the usual Barabasi-Albert seed
+def initial_star(m):
+    sources = np.full(m, m, dtype=np.int64)
+    targets = np.arange(m, dtype=np.int64)
+    degrees = np.ones(m + 1, dtype=np.int64)
+    degrees[m] = m
+    return sources, targets, degrees
+
+
+def barabasi_albert(num_nodes, m=2, rng=None, offset=0.0, exponent=1.0):
+    """
+    Undirected Barabasi-Albert graph on num_nodes nodes grown from initial_star(m),
+    as (sources, targets) edge arrays.
+    """
+    sources, targets, degrees = initial_star(m)
+    if num_nodes <= m + 1:
+        keep = sources < num_nodes
+        return sources[keep], targets[keep]
+    new_sources, new_targets = attach(
+        degrees, num_nodes - m - 1, m, rng, offset, exponent
+    )
+    return (
+        np.concatenate([sources, new_sources]),
+        np.concatenate([targets, new_targets]),
+    )
+
+
+def barabasi_albert_batch(num_graphs, num_nodes, m=2, rng=None):
+    """
+    num_graphs independent Barabasi-Albert graphs grown together, vectorized across
+    graphs. Every graph has the same edge sources, so this returns a (num_edges,)
+    sources array and a (num_graphs, num_edges) targets array.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    sources, targets, _ = initial_star(m)
+    num_new_nodes = max(num_nodes - m - 1, 0)
+    num_edges = m + m * num_new_nodes
+
+    # every graph's repeated-nodes list grows by 2m entries per new node, so the
+    # lists stay the same length and one draw covers every graph
+    nodes = np.empty((num_graphs, 2 * num_edges), dtype=np.int64)
+    nodes[:, :m] = targets
+    nodes[:, m : 2 * m] = m
+    length = 2 * m
+
+    all_targets = np.empty((num_graphs, num_edges), dtype=np.int64)
+    all_targets[:, :m] = targets
+    rows = np.arange(num_graphs)[:, None]
+    for source in range(m + 1, m + 1 + num_new_nodes):
+        chosen = nodes[rows, rng.integers(length, size=(num_graphs, m))]
+        # redraw repeated targets until every graph has m distinct ones
+        for j in range(1, m):
+            repeated = (chosen[:, j, None] == chosen[:, :j]).any(axis=1)
+            while repeated.any():
+                redraw = np.flatnonzero(repeated)
+                chosen[redraw, j] = nodes[
+                    redraw, rng.integers(length, size=len(redraw))
+                ]
+                repeated = (chosen[:, j, None] == chosen[:, :j]).any(axis=1)
+
+        edge = m * (source - m)
+        all_targets[:, edge : edge + m] = chosen
+        nodes[:, length : length + m] = chosen
+        nodes[:, length + m : length + 2 * m] = source
+        length += 2 * m
+
+    all_sources = np.concatenate(
+        [sources, np.repeat(np.arange(m + 1, m + 1 + num_new_nodes), m)]
+    )
+    keep = all_sources < num_nodes
+    return all_sources[keep], all_targets[:, keep]
+
+
+class PreferentialAttachment:
+    """
+    Op for SampleableRandomGraph.operate that grows a sampled world by num_new_nodes
+    nodes in one step, attaching each one to m distinct existing nodes with
+    probability proportional to (in-degree + offset) ** exponent. With the defaults,
+    this is utils.BA applied num_new_nodes times, except that targets are distinct.
+    """
+
+    def __init__(self, num_new_nodes=1, m=2, offset=0.0, exponent=1.0):
+        self.num_new_nodes = num_new_nodes
+        self.m = m
+        self.offset = offset
+        self.exponent = exponent
+
+    # returns the new (sources, targets) edges; the new nodes are numbered after the
+    # existing ones. uniforms, an iter_uniforms iterator, lets a caller growing many
+    # worlds share one stream of draws instead of drawing a new batch per world
+    def grow(self, out_adj_list, in_adj_list, rng=None, uniforms=None):
+        degrees = [len(in_adj_list[node]) for node in range(len(in_adj_list))]
+        if uniforms is None:
+            rng = np.random.default_rng() if rng is None else rng
+            uniforms = iter_uniforms(rng, self.num_new_nodes * self.m)
+        sources, targets = attach(
+            degrees,
+            self.num_new_nodes,
+            self.m,
+            offset=self.offset,
+            exponent=self.exponent,
+            uniforms=uniforms,
+        )
+        return sources, targets
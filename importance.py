@@ -0,0 +1,182 @@
+"""
+Importance sampling for tail probabilities P(stat >= threshold) of a
+SampleableRandomGraph, which plain Monte Carlo rarely reaches. Worlds are drawn
+from a proposal that keeps the edges independent but changes their probabilities,
+and each world is reweighted by its likelihood ratio under the graph's own edge
+probabilities. Observed edges are pinned in both distributions, so they never
+contribute to the ratio.
+"""
+
+import math
+import numpy as np
+from graph_stats import get_statistic
+from profiling import Stats
+from utils import count_triangles
+
+# cross-entropy proposals keep free edges this far from 0 and 1, so likelihood
+# ratios stay bounded
+PROB_CLIP = 1e-3
+
+
+class ImportanceSampling:
+    def __init__(
+        self,
+        num_samples=10000,
+        batch_size=1000,
+        method="ce",
+        tilt=1.0,
+        pilot_samples=2000,
+        rho=0.1,
+        smoothing=0.7,
+        max_iterations=20,
+        seed=None,
+    ):
+        # method "tilt" shifts the log-odds of every free edge by tilt. Method "ce" fits
+        # the proposal by cross-entropy: each pilot run of pilot_samples worlds raises
+        # the level to its (1 - rho) quantile (capped at the threshold) and refits the
+        # edge probabilities to the worlds above it, until the level reaches the
+        # threshold or max_iterations runs are done
+        self.num_samples = num_samples
+        self.batch_size = batch_size
+        self.method = method
+        self.tilt = tilt
+        self.pilot_samples = pilot_samples
+        self.rho = rho
+        self.smoothing = smoothing
+        self.max_iterations = max_iterations
+        self.seed = seed
+        self.diagnostics = None
+        self.stats = Stats()
+
+    # estimates P(stat >= threshold); returns (estimate, variance of the estimate)
+    def pr_tail(self, G, threshold, stat=count_triangles):
+        statistic = get_statistic(stat)
+        if G.ops or statistic is None:
+            raise ValueError(
+                "Importance sampling needs a batched statistic and no ops."
+            )
+
+        rng = np.random.default_rng(self.seed)
+        _, _, probs = G.edge_arrays()
+        probs = probs.astype(np.float64)
+        free = free_edges(G, probs)
+
+        levels = []
+        if self.method == "tilt":
+            proposal = tilted(probs, free, self.tilt)
+        elif self.method == "ce":
+            with self.stats.phase("cross_entropy"):
+                proposal, levels = self._cross_entropy(
+                    G, statistic, probs, free, threshold, rng
+                )
+        else:
+            raise ValueError(f"Unknown importance sampling method {self.method}.")
+
+        total = 0.0
+        total_sq = 0.0
+        for _, values, log_weights in self._draw(
+            G, statistic, probs, proposal, self.num_samples, rng
+        ):
+            weights = np.where(values >= threshold, np.exp(log_weights), 0.0)
+            total += weights.sum()
+            total_sq += (weights**2).sum()
+
+        estimate = total / self.num_samples
+        variance = (
+            max(total_sq / self.num_samples - estimate**2, 0.0) / self.num_samples
+        )
+        self.diagnostics = {
+            "variance": variance,
+            "relative_error": (
+                math.sqrt(variance) / estimate if estimate > 0 else math.inf
+            ),
+            "levels": levels,
+            "converged": True,
+            "proposal": proposal,
+            "num_samples": self.num_samples + len(levels) * self.pilot_samples,
+        }
+        return estimate, variance
+
+    def _cross_entropy(self, G, statistic, probs, free, threshold, rng):
+        proposal = probs.copy()
+        levels = []
+        for _ in range(self.max_iterations):
+            draws = list(
+                self._draw(G, statistic, probs, proposal, self.pilot_samples, rng)
+            )
+            worlds = np.concatenate([w for w, _, _ in draws])
+            values = np.concatenate([v for _, v, _ in draws])
+            log_weights = np.concatenate([lw for _, _, lw in draws])
+
+            level = min(threshold, np.quantile(values, 1 - self.rho))
+            # with ties (e.g. integer counts) the quantile can repeat the previous
+            # level, which would refit the same proposal forever; the level moves
+            # to the smallest value above it instead
+            if levels and level <= levels[-1]:
+                above = values[values > levels[-1]]
+                if len(above) == 0:
+                    break
+                level = min(threshold, above.min())
+            levels.append(float(level))
+            elite = values >= level
+            # weights are only needed up to scale
+            weights = np.exp(log_weights - log_weights[elite].max()) * elite
+            fitted = weights @ worlds / weights.sum()
+
+            proposal[free] = np.clip(
+                self.smoothing * fitted[free] + (1 - self.smoothing) * proposal[free],
+                PROB_CLIP,
+                1 - PROB_CLIP,
+            )
+            if level >= threshold:
+                return proposal, levels
+
+        self.diagnostics = {"levels": levels, "converged": False}
+        raise ValueError(
+            f"Cross-entropy stopped at level {levels[-1] if levels else None} below "
+            f"the threshold "
+            f"{threshold} after {len(levels)} iterations; increase pilot_samples, "
+            "rho or max_iterations."
+        )
+
+    # yields (worlds, stat values, log likelihood ratios) for num_samples worlds drawn
+    # from proposal, a batch at a time
+    def _draw(self, G, statistic, probs, proposal, num_samples, rng):
+        slope, intercept = log_ratio_terms(probs, proposal)
+        for start in range(0, num_samples, self.batch_size):
+            k = min(self.batch_size, num_samples - start)
+            with self.stats.phase("sample"):
+                worlds = G.sample_batch(k, rng=rng, probs=proposal)
+            with self.stats.phase("statistic"):
+                values = np.asarray(
+                    statistic.batched(G.to_adjacency(worlds)), dtype=float
+                )
+            self.stats.count("samples", k)
+            yield worlds, values, worlds @ slope + intercept
+
+
+# edges whose state is random under G: 0 < p < 1 and not observed
+def free_edges(G, probs):
+    free = (probs > 0) & (probs < 1)
+    for (s, t), _ in G.observations:
+        free[G.edge_column(s, t)] = False
+    return free
+
+
+# exponential tilt of the free edges: log-odds shifted by tilt
+def tilted(probs, free, tilt):
+    proposal = probs.copy()
+    odds = probs[free] * math.exp(tilt)
+    proposal[free] = odds / (1 - probs[free] + odds)
+    return proposal
+
+
+# log p(x) / q(x) = x @ slope + intercept for independent edges; only edges whose
+# proposal probability differs contribute
+def log_ratio_terms(probs, proposal):
+    slope = np.zeros(len(probs))
+    changed = proposal != probs
+    p, q = probs[changed], proposal[changed]
+    slope[changed] = np.log(p / q) - np.log((1 - p) / (1 - q))
+    intercept = np.log((1 - p) / (1 - q)).sum()
+    return slope, intercept
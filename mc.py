@@ -1,23 +1,241 @@
 import numpy as np
-from utils import count_triangles
-from math import comb
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from graph_stats import get_statistic
+from profiling import Stats
+from storage import SampleBank
+from utils import count_triangles, count_triangles_batch, to_dist
+from math import sqrt
+from statistics import NormalDist
+
+# seeded samples are drawn in blocks of this many worlds, each from its own
+# generator spawned from the seed, so a seeded result does not depend on workers
+SEED_BLOCK = 1 << 12
 
 
 class MonteCarlo:
-    def __init__(self, num_samples=1000):
+    def __init__(
+        self,
+        num_samples=1000,
+        batch_size=None,
+        workers=None,
+        seed=None,
+        incremental=False,
+        bank_dir=None,
+    ):
+        # with bank_dir, sampled worlds are kept in a SampleBank there and reused by
+        # later queries (and processes) on the same graph and observations
         self.num_samples = num_samples
+        self.batch_size = batch_size
+        self.workers = workers
+        self.seed = seed
+        self.incremental = incremental
+        self.bank_dir = bank_dir
+        self.cache = None
+        # phases: sample, statistic, load (reading banked worlds), recount
+        # (incremental); counters: samples, cache_hits, bank_hits
+        self.stats = Stats()
+
+    def pr(self, G, stat=count_triangles, use_cached=False, dense=False):
+        if self.incremental and stat is count_triangles and not G.ops and G.undirected:
+            counts = self._incremental_histogram(G)
+        elif self.bank_dir is not None:
+            counts = self._bank_histogram(G, stat)
+        elif self.workers:
+            counts = self._sample_parallel(G, stat)
+        elif self.seed is None:
+            counts = sample_histogram(
+                G, stat, self.num_samples, self.batch_size, stats=self.stats
+            )
+        else:
+            blocks = seed_blocks(self.seed, self.num_samples)
+            counts = sample_blocks(G, stat, blocks, self.batch_size, self.stats)
+        return to_dist(counts, self.num_samples, G.num_nodes, dense)
+
+    # evaluates several statistics (registered names or Statistic objects) on the
+    # same sampled worlds in one pass; returns {name: sparse distribution}
+    def pr_multi(self, G, stats=("triangles", "degree_histogram")):
+        statistics = [get_statistic(stat) for stat in stats]
+        rng = None if self.seed is None else np.random.default_rng(self.seed)
+        counts = [Counter() for _ in statistics]
+
+        if self.batch_size and not G.ops:
+            remaining = self.num_samples
+            while remaining > 0:
+                k = min(self.batch_size, remaining)
+                with self.stats.phase("sample"):
+                    adj = G.to_adjacency(G.sample_batch(k, rng=rng))
+                with self.stats.phase("statistic"):
+                    for statistic, hist in zip(statistics, counts):
+                        hist.update(as_list(statistic.batched(adj)))
+                remaining -= k
+        else:
+            for _ in range(self.num_samples):
+                with self.stats.phase("sample"):
+                    world = G.sample(None, rng=rng)
+                with self.stats.phase("statistic"):
+                    for statistic, hist in zip(statistics, counts):
+                        hist[statistic.per_world(*world)] += 1
+        self.stats.count("samples", self.num_samples)
 
-    def pr(self, G, stat=count_triangles, use_cached=False):
-        samples = []
-        for _ in range(self.num_samples):
-            samples.append(G.sample(stat))
-        values, counts = np.unique(samples, return_counts=True)
-        dist = counts / self.num_samples
-        dist = dict(zip(values, dist))
-        dist = {
-            t: dist[t] if t in dist else 0.0 for t in range(comb(G.num_nodes, 3) + 1)
+        return {
+            statistic.name: to_dist(hist, self.num_samples, G.num_nodes)
+            for statistic, hist in zip(statistics, counts)
         }
-        return dist
+
+    # yields the statistic of every sampled world as it is drawn, so consumers can
+    # trace, summarize or stop early without the solver keeping any samples
+    def iter_samples(self, G, stat=count_triangles, num_samples=None):
+        num_samples = self.num_samples if num_samples is None else num_samples
+        rng = None if self.seed is None else np.random.default_rng(self.seed)
+        for chunk in sample_chunks(
+            G, stat, num_samples, self.batch_size, rng, self.stats
+        ):
+            yield from chunk
+
+    # yields (samples drawn so far, running histogram) every `every` samples
+    def iter_histograms(self, G, stat=count_triangles, every=1000, num_samples=None):
+        counts = Counter()
+        num_seen = 0
+        for value in self.iter_samples(G, stat, num_samples):
+            counts[value] += 1
+            num_seen += 1
+            if num_seen % every == 0:
+                yield num_seen, Counter(counts)
+        if num_seen % every != 0:
+            yield num_seen, Counter(counts)
+
+    # samples in batches until the estimated distribution is within tolerance:
+    # criterion "ci" bounds every bin's confidence-interval half-width, "tv" bounds
+    # the total-variation error; returns (dist, num_samples used, error estimates)
+    def pr_adaptive(
+        self,
+        G,
+        stat=count_triangles,
+        tolerance=0.01,
+        criterion="ci",
+        confidence=0.95,
+        batch_size=1000,
+        max_samples=10**6,
+        dense=False,
+    ):
+        if criterion not in ("ci", "tv"):
+            raise ValueError(f"Unknown stopping criterion: {criterion}")
+
+        rng = None if self.seed is None else np.random.default_rng(self.seed)
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        counts = Counter()
+        num_samples = 0
+        while num_samples < max_samples:
+            k = min(batch_size, max_samples - num_samples)
+            counts.update(
+                sample_histogram(G, stat, k, self.batch_size, rng, self.stats)
+            )
+            num_samples += k
+
+            errors = wilson_errors(counts, num_samples, z)
+            if errors[criterion] <= tolerance:
+                break
+
+        return to_dist(counts, num_samples, G.num_nodes, dense), num_samples, errors
+
+    # keeps the sampled worlds and their triangle counts between queries (for the
+    # same graph, num_samples and seed); each new edge observation only recounts
+    # |N(s) & N(t)| in the worlds it flips
+    def _incremental_histogram(self, G):
+        cache = self.cache
+        if (
+            cache is None
+            or cache["graph"] is not G
+            or cache["num_samples"] != self.num_samples
+            or cache["seed"] != self.seed
+            or G.observations[: len(cache["observations"])] != cache["observations"]
+        ):
+            rng = None if self.seed is None else np.random.default_rng(self.seed)
+            with self.stats.phase("sample"):
+                adj = G.to_adjacency(G.sample_batch(self.num_samples, rng=rng))
+            self.stats.count("samples", self.num_samples)
+            batch_size = self.batch_size or self.num_samples
+            with self.stats.phase("statistic"):
+                counts = np.concatenate(
+                    [
+                        count_triangles_batch(adj[i : i + batch_size])
+                        for i in range(0, self.num_samples, batch_size)
+                    ]
+                )
+            cache = {
+                "graph": G,
+                "num_samples": self.num_samples,
+                "seed": self.seed,
+                "observations": list(G.observations),
+                "adj": adj,
+                "counts": counts,
+            }
+            self.cache = cache
+        else:
+            self.stats.count("cache_hits")
+
+        adj, counts = cache["adj"], cache["counts"]
+        with self.stats.phase("recount"):
+            for (s, t), pos in G.observations[len(cache["observations"]) :]:
+                common = (adj[:, s, :] & adj[:, t, :]).sum(axis=1)
+                # a self-loop is never part of a triangle
+                flipped = (adj[:, s, t] != (pos == 1)) & (s != t)
+                counts[flipped] += common[flipped] if pos == 1 else -common[flipped]
+                adj[:, s, t] = adj[:, t, s] = pos == 1
+                cache["observations"].append(((s, t), pos))
+
+        values, freqs = np.unique(counts, return_counts=True)
+        return Counter(dict(zip(values.tolist(), freqs.tolist())))
+
+    # tops the graph's sample bank up to num_samples worlds, then evaluates stat on
+    # its first num_samples worlds
+    def _bank_histogram(self, G, stat):
+        statistic = get_statistic(stat)
+        if G.ops or statistic is None:
+            raise ValueError("Sample banks need a batched statistic and no ops.")
+        bank = SampleBank.for_graph(self.bank_dir, G)
+        batch_size = self.batch_size or self.num_samples
+
+        # seeded by the bank size too, so topping up never repeats banked worlds
+        rng = None
+        if self.seed is not None:
+            rng = np.random.default_rng([self.seed, len(bank)])
+        remaining = self.num_samples - len(bank)
+        self.stats.count("bank_hits", self.num_samples - max(remaining, 0))
+        self.stats.count("samples", max(remaining, 0))
+        while remaining > 0:
+            k = min(batch_size, remaining)
+            with self.stats.phase("sample"):
+                bank.append(G.sample_batch(k, rng=rng, packed=True), packed=True)
+            remaining -= k
+
+        counts = Counter()
+        for start in range(0, self.num_samples, batch_size):
+            with self.stats.phase("load"):
+                # the bank may hold more worlds than this query uses
+                stop = min(start + batch_size, self.num_samples)
+                adj = G.to_adjacency(bank.worlds(start, stop), packed=True)
+            with self.stats.phase("statistic"):
+                counts.update(as_list(statistic.batched(adj)))
+        return counts
+
+    # splits the seed blocks across a process pool; each worker ships back a
+    # histogram, so the merged result is the serial one for the same seed
+    def _sample_parallel(self, G, stat):
+        blocks = seed_blocks(self.seed, self.num_samples)
+        counts = Counter()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for hist in pool.map(
+                sample_blocks,
+                [G] * self.workers,
+                [stat] * self.workers,
+                [blocks[w :: self.workers] for w in range(self.workers)],
+                [self.batch_size] * self.workers,
+            ):
+                counts.update(hist)
+        self.stats.count("samples", self.num_samples)
+        return counts
 
     def observe_edge(self, G, s, t):
         return G.observe_edge(s, t)
@@ -27,3 +245,78 @@ class MonteCarlo:
 
     def observe_triangle(self, G, a, b, c):
         return G.observe_triangle(a, b, c)
+
+
+# yields the statistic over num_samples worlds of G in chunks, sampled in batches
+# when possible
+def sample_chunks(G, stat, num_samples, batch_size=None, rng=None, stats=None):
+    stats = Stats() if stats is None else stats
+    statistic = get_statistic(stat)
+    if batch_size and not G.ops and statistic is not None:
+        remaining = num_samples
+        while remaining > 0:
+            k = min(batch_size, remaining)
+            with stats.phase("sample"):
+                adj = G.to_adjacency(G.sample_batch(k, rng=rng))
+            with stats.phase("statistic"):
+                values = as_list(statistic.batched(adj))
+            stats.count("samples", k)
+            yield values
+            remaining -= k
+    else:
+        per_world = stat if statistic is None else statistic.per_world
+        for _ in range(num_samples):
+            with stats.phase("sample"):
+                world = G.sample(None, rng=rng)
+            with stats.phase("statistic"):
+                value = per_world(*world)
+            stats.count("samples")
+            yield [value]
+
+
+def as_list(values):
+    return values.tolist() if isinstance(values, np.ndarray) else list(values)
+
+
+# histogram of stat over num_samples worlds of G
+def sample_histogram(G, stat, num_samples, batch_size=None, rng=None, stats=None):
+    counts = Counter()
+    for chunk in sample_chunks(G, stat, num_samples, batch_size, rng, stats):
+        counts.update(chunk)
+    return counts
+
+
+# Wilson score half-widths per observed bin; their worst case bounds every bin
+# ("ci") and half their sum bounds the total-variation error ("tv")
+def wilson_errors(counts, num_samples, z):
+    half_widths = {}
+    for t, c in counts.items():
+        p = c / num_samples
+        half_widths[t] = (
+            z
+            / (1 + z**2 / num_samples)
+            * sqrt(p * (1 - p) / num_samples + z**2 / (4 * num_samples**2))
+        )
+    return {
+        "bins": half_widths,
+        "ci": max(half_widths.values(), default=0.0),
+        "tv": sum(half_widths.values()) / 2,
+    }
+
+
+# (size, SeedSequence) blocks covering num_samples worlds; see SEED_BLOCK
+def seed_blocks(seed, num_samples):
+    sizes = [
+        min(SEED_BLOCK, num_samples - start)
+        for start in range(0, num_samples, SEED_BLOCK)
+    ]
+    return list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+
+# histogram of stat over the worlds of the given seed blocks
+def sample_blocks(G, stat, blocks, batch_size=None, stats=None):
+    counts = Counter()
+    for size, seed in blocks:
+        rng = np.random.default_rng(seed)
+        counts.update(sample_histogram(G, stat, size, batch_size, rng, stats))
+    return counts
@@ -1,89 +1,335 @@
+import math
+import time
+import numpy as np
 import torch
-from torch_geometric.utils import degree
-from utils import sp_count_triangles
-from math import comb
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from profiling import Stats
+from utils import sp_count_triangles, to_dist
+
+# candidate (i, j, k) moves drawn per vectorized batch, and filtered against the
+# current state FILTER_WINDOW at a time (an accepted move re-filters one window)
+PROPOSAL_BATCH = 1024
+FILTER_WINDOW = 32
+
 
 class MarkovChainMonteCarlo:
-    def __init__(self, num_samples=1000):
+    def __init__(
+        self,
+        num_samples=1000,
+        num_chains=1,
+        burn_in=0,
+        thin=1,
+        workers=None,
+        seed=None,
+        rhat_threshold=None,
+        check_every=100,
+    ):
+        # num_samples is per chain; with rhat_threshold set it is an upper bound and
+        # chains stop early once the split R-hat of the triangle trace drops below it
         self.num_samples = num_samples
+        self.num_chains = num_chains
+        self.burn_in = burn_in
+        self.thin = thin
+        self.workers = workers
+        self.seed = seed
+        self.rhat_threshold = rhat_threshold
+        self.check_every = check_every
+        self.diagnostics = None
+        self.stats = Stats()
+
+    def pr(self, G, dense=False):
+        chunk = self.num_samples if self.rhat_threshold is None else self.check_every
+        traces = [[] for _ in range(self.num_chains)]
+        for new_traces in self._rounds(G, chunk):
+            for trace, new_trace in zip(traces, new_traces):
+                trace.extend(new_trace)
+
+        traces = np.array(traces)
+        self.diagnostics = {
+            "rhat": gelman_rubin(traces),
+            "ess": effective_sample_size(traces),
+            "num_chains": self.num_chains,
+            "num_samples": traces.shape[1],
+        }
+
+        values, counts = np.unique(traces, return_counts=True)
+        return to_dist(
+            dict(zip(values.tolist(), counts.tolist())), traces.size, G.num_nodes, dense
+        )
+
+    # yields the recorded triangle counts as the chains produce them, check_every
+    # samples per chain at a time (chain by chain within each round)
+    def iter_samples(self, G):
+        for new_traces in self._rounds(G, self.check_every):
+            for trace in new_traces:
+                yield from trace
+
+    # yields (samples recorded so far, running histogram) after every round
+    def iter_histograms(self, G):
+        counts = Counter()
+        num_seen = 0
+        for new_traces in self._rounds(G, self.check_every):
+            for trace in new_traces:
+                counts.update(trace)
+                num_seen += len(trace)
+            yield num_seen, Counter(counts)
+
+    # advances every chain chunk samples at a time up to num_samples, yielding each
+    # round's new per-chain traces; stops early once the split R-hat falls below
+    # rhat_threshold (only then are past traces kept). With workers, one process
+    # pool serves every round, and is shut down when the rounds end or the caller
+    # stops iterating
+    def _rounds(self, G, chunk):
+        if self.seed is None:
+            # follow the global torch RNG, so torch.manual_seed still fixes the run
+            seeds = torch.randint(2**62, (self.num_chains,)).tolist()
+        else:
+            seeds = [
+                int(s.generate_state(1, dtype=np.uint64)[0]) >> 1
+                for s in np.random.SeedSequence(self.seed).spawn(self.num_chains)
+            ]
+        chains = [Chain(G, seed, self.burn_in, self.thin) for seed in seeds]
+
+        traces = [[] for _ in chains]
+        num_seen = 0
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers else None
+        try:
+            while num_seen < self.num_samples:
+                num_steps = min(chunk, self.num_samples - num_seen)
+                chains, new_traces = self._advance(chains, num_steps, pool)
+                num_seen += num_steps
+                yield new_traces
+
+                if self.rhat_threshold is not None:
+                    for trace, new_trace in zip(traces, new_traces):
+                        trace.extend(new_trace)
+                    if gelman_rubin(np.array(traces)) < self.rhat_threshold:
+                        break
+        finally:
+            if pool is not None:
+                pool.shutdown()
 
+    def _advance(self, chains, num_steps, pool=None):
+        before = [chain.counters() for chain in chains]
+        with self.stats.phase("advance"):
+            if pool is None:
+                results = [_advance_chain(chain, num_steps) for chain in chains]
+            else:
+                results = list(
+                    pool.map(_advance_chain, chains, [num_steps] * len(chains))
+                )
+        chains = [chain for chain, _ in results]
+
+        # chains count their own moves, since they may run in worker processes
+        for (proposed, accepted, seconds), chain in zip(before, chains):
+            num_proposals, num_accepted, proposal_time = chain.counters()
+            self.stats.count("proposals", num_proposals - proposed)
+            self.stats.count("accepted", num_accepted - accepted)
+            self.stats.count(
+                "rejected", num_proposals - proposed - (num_accepted - accepted)
+            )
+            self.stats.add_time("proposals", proposal_time - seconds)
+        return chains, [trace for _, trace in results]
+
+
+def _advance_chain(chain, num_steps):
+    trace = chain.advance(num_steps)
+    return chain, trace
+
+
+class Chain:
     # Algorithm 13 from https://academic.oup.com/book/40058/chapter-abstract/340605713
-    def pr(self, G):
+    # with its own torch generator; picklable so chains can move between processes
+    def __init__(self, G, seed, burn_in=0, thin=1):
         edge_index = G.initial_graph
-        N = G.num_nodes
-        L = G.num_links
-        m = G.deg_dist
-
-        deg = degree(edge_index[0], num_nodes=N)
-        sigma = (deg ** 2).sum().item()
-
-        num_triangles = sp_count_triangles(edge_index)
-        delta_ij = 0
-        delta_ik = 0
-
-        ei = edge_index.clone()
-
-        dist = {}
-
-        for _ in range(self.num_samples):
-            if num_triangles not in dist:
-                dist[num_triangles] = 0.0
-            dist[num_triangles] += 1 / self.num_samples
-
-            while True:
-                i, j = ei[:, torch.randint(ei.size(1), (1,))[0]]
-                i = i.item()
-                j = j.item()
-                assert ((ei[0] == j) & (ei[1] == i)).any()
-
-                node_dist = torch.ones(N)
-                node_dist[i] = 0
-                node_dist[j] = 0
-                k = node_dist.multinomial(1)[0]
-                k = k.item()
-
-                if (k != ei[1, ei[0] == i]).all():
-                    break
-
-            sigma_prime = (sigma + 2 * (1 + deg[k] - deg[j])).item()
-            p_execute_move = (
-                ((N - 1) * L - sigma)
-                * torch.exp(m.log_prob(deg[j] - 1))
-                * torch.exp(m.log_prob(deg[k] + 1))
+        self.N = G.num_nodes
+        self.L = G.num_links
+        self.thin = thin
+
+        # chain state: the directed edge list as src / dst arrays with an edge ->
+        # position map, a dense adjacency bitmap for bulk proposal filtering, and
+        # per-node neighbor sets so triangle deltas are O(deg)
+        self.src = edge_index[0].numpy().copy()
+        self.dst = edge_index[1].numpy().copy()
+        self.positions = {
+            e: pos for pos, e in enumerate(zip(self.src.tolist(), self.dst.tolist()))
+        }
+        self.adj = np.zeros((self.N, self.N), dtype=bool)
+        self.adj[self.src, self.dst] = True
+        self.nbrs = [set(np.flatnonzero(row).tolist()) for row in self.adj]
+        self.deg = [len(adj) for adj in self.nbrs]
+        self.sigma = sum(d**2 for d in self.deg)
+        # bumped on every accepted move so pending proposals get re-filtered
+        self.version = 0
+
+        self.num_triangles = round(sp_count_triangles(edge_index))
+
+        # degree probabilities under m for every degree 0..N-1 (N is unreachable)
+        self.deg_probs = torch.exp(G.deg_dist.log_prob(torch.arange(self.N))).tolist()
+        self.deg_probs.append(0.0)
+
+        generator = torch.Generator()
+        generator.manual_seed(seed)
+        self.rng_state = generator.get_state()
+        self.burn_in = burn_in
+
+        # moves proposed and accepted, and seconds spent drawing proposal batches
+        self.num_proposals = 0
+        self.num_accepted = 0
+        self.proposal_time = 0.0
+
+    def counters(self):
+        return self.num_proposals, self.num_accepted, self.proposal_time
+
+    # records the triangle count num_steps times, moving thin steps in between;
+    # the first call runs the burn-in first
+    def advance(self, num_steps):
+        generator = torch.Generator()
+        generator.set_state(self.rng_state)
+        proposals = self.proposals(generator)
+
+        self.move(proposals, self.burn_in)
+        self.burn_in = 0
+
+        trace = []
+        for _ in range(num_steps):
+            trace.append(self.num_triangles)
+            self.move(proposals, self.thin)
+
+        self.rng_state = generator.get_state()
+        return trace
+
+    # yields valid (i, j, k, r) proposals: a uniform edge i - j, a uniform node k
+    # other than i and j that is not already adjacent to i, and an acceptance draw.
+    # Candidates are drawn and filtered in batches; an accepted move changes the
+    # state, so the rest of the batch is filtered again before it is consumed.
+    def proposals(self, generator):
+        while True:
+            start_time = time.perf_counter()
+            pos = torch.randint(len(self.src), (PROPOSAL_BATCH,), generator=generator)
+            offsets = torch.randint(self.N - 2, (PROPOSAL_BATCH,), generator=generator)
+            rs = torch.rand(PROPOSAL_BATCH, generator=generator, dtype=torch.float64)
+            pos, offsets, rs = pos.numpy(), offsets.numpy(), rs.tolist()
+            self.proposal_time += time.perf_counter() - start_time
+
+            start = 0
+            while start < PROPOSAL_BATCH:
+                version = self.version
+                window = slice(start, start + FILTER_WINDOW)
+                i = self.src[pos[window]]
+                j = self.dst[pos[window]]
+                k = offsets[window] + (offsets[window] >= np.minimum(i, j))
+                k += k >= np.maximum(i, j)
+
+                valid = np.flatnonzero(~self.adj[i, k])
+                candidates = zip(
+                    valid.tolist(),
+                    i[valid].tolist(),
+                    j[valid].tolist(),
+                    k[valid].tolist(),
+                )
+                start += len(i)
+                for v, i_v, j_v, k_v in candidates:
+                    yield i_v, j_v, k_v, rs[window.start + v]
+                    if self.version != version:
+                        start = window.start + v + 1
+                        break
+
+    def move(self, proposals, num_moves):
+        N, L = self.N, self.L
+        positions, nbrs, deg = self.positions, self.nbrs, self.deg
+        deg_probs = self.deg_probs
+
+        self.num_proposals += num_moves
+        for _ in range(num_moves):
+            i, j, k, r = next(proposals)
+
+            sigma_prime = self.sigma + 2 * (1 + deg[k] - deg[j])
+            numerator = (
+                ((N - 1) * L - self.sigma)
+                * deg_probs[deg[j] - 1]
+                * deg_probs[deg[k] + 1]
                 * (deg[k] + 1)
             )
-            p_execute_move /= (
+            denominator = (
                 ((N - 1) * L - sigma_prime)
-                * torch.exp(m.log_prob(deg[j]))
-                * torch.exp(m.log_prob(deg[k]))
+                * deg_probs[deg[j]]
+                * deg_probs[deg[k]]
                 * deg[j]
             )
+            if denominator == 0:
+                p_execute_move = math.inf if numerator > 0 else math.nan
+            else:
+                p_execute_move = numerator / denominator
+
+            if r < p_execute_move:
+                self.num_accepted += 1
+                delta_ij = -len(nbrs[i] & nbrs[j])
+
+                # rewire i - j to i - k in place, in both directions
+                pos_1 = positions.pop((i, j))
+                pos_2 = positions.pop((j, i))
+                self.dst[pos_1] = k
+                self.src[pos_2] = k
+                positions[(i, k)] = pos_1
+                positions[(k, i)] = pos_2
 
-            r = torch.rand(1)[0].item()
-            if r < p_execute_move.item():
-                pos_1 = (ei[0] == i) & (ei[1] == j)
-                pos_2 = (ei[0] == j) & (ei[1] == i)
-            
-                adj_i_1 = ei[1, ei[0] == i]
-                adj_j = ei[1, ei[0] == j]
+                self.adj[i, j] = self.adj[j, i] = False
+                self.adj[i, k] = self.adj[k, i] = True
+                nbrs[i].remove(j)
+                nbrs[j].remove(i)
+                nbrs[i].add(k)
+                nbrs[k].add(i)
+                self.version += 1
 
-                ei[1, pos_1] = k
-                ei[0, pos_2] = k
-                
-                sigma = sigma_prime
+                self.sigma = sigma_prime
 
                 deg[k] += 1
                 deg[j] -= 1
 
-                adj_i_2 = ei[1, ei[0] == i]
-                adj_k = ei[1, ei[0] == k]
+                delta_ik = len(nbrs[i] & nbrs[k])
+                self.num_triangles += delta_ik + delta_ij
 
-                delta_ij = -(adj_i_1.reshape(-1, 1) == adj_j).sum()
-                delta_ik = (adj_i_2.reshape(-1, 1) == adj_k).sum()
-                num_triangles += (delta_ik + delta_ij).item()
-        
-        dist = {
-            t : dist[t] if t in dist else 0.0 for t in range(comb(G.num_nodes, 3) + 1)
-        }
-        return dist
-       
+
+# split R-hat: every chain is halved so a single chain still gets a diagnostic
+def gelman_rubin(traces):
+    n = traces.shape[1] // 2
+    if n < 2:
+        return math.nan
+    halves = np.concatenate([traces[:, :n], traces[:, n : 2 * n]]).astype(float)
+
+    W = halves.var(axis=1, ddof=1).mean()
+    B = n * halves.mean(axis=1).var(ddof=1)
+    if W == 0:
+        return 1.0 if B == 0 else math.inf
+    var_hat = (n - 1) / n * W + B / n
+    return math.sqrt(var_hat / W)
+
+
+# multi-chain effective sample size with Geyer's initial positive sequence
+def effective_sample_size(traces):
+    m, n = traces.shape
+    if n < 4:
+        return float(m * n)
+    x = traces.astype(float)
+
+    W = x.var(axis=1, ddof=1).mean()
+    var_hat = (n - 1) / n * W + (x.mean(axis=1).var(ddof=1) if m > 1 else 0.0)
+    if var_hat == 0:
+        return float(m * n)
+
+    # per-chain autocovariances via FFT
+    centered = x - x.mean(axis=1, keepdims=True)
+    spectrum = np.fft.rfft(centered, n=2 * n, axis=1)
+    acov = np.fft.irfft(spectrum * np.conj(spectrum), axis=1)[:, :n] / n
+    rho = 1 - (W - acov.mean(axis=0)) / var_hat
+    rho[0] = 1.0
+
+    tau = -1.0
+    for t in range(0, n - 1, 2):
+        pair = rho[t] + rho[t + 1]
+        if pair <= 0:
+            break
+        tau += 2 * pair
+    return float(m * n / tau)
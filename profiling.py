@@ -0,0 +1,107 @@
+"""
+Opt-in instrumentation for the solvers. Every solver has a Stats object as
+solver.stats, which is disabled by default. While disabled, phase() returns a shared
+no-op context manager and count() returns immediately, so the hooks cost a method
+call. Enable it with solver.stats.enable() (optionally with track_memory=True) to
+collect:
+
+- timers: total seconds and number of calls of each named phase
+- counters: named event counts (samples drawn, worlds enumerated, cache hits, ...)
+- memory: the peak number of bytes traced by tracemalloc during each phase
+
+Stats.to_json() exports all three.
+"""
+
+import json
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+NULL_PHASE = nullcontext()
+
+
+class Stats:
+    def __init__(self, enabled=False, track_memory=False):
+        self.enabled = enabled
+        self.track_memory = track_memory
+        self.reset()
+
+    def enable(self, track_memory=False):
+        self.enabled = True
+        self.track_memory = track_memory
+        return self
+
+    def disable(self):
+        self.enabled = False
+        return self
+
+    def reset(self):
+        self.timers = {}
+        self.counters = {}
+        self.memory = {}
+        # (start bytes, peak bytes so far) of the open phases, innermost last
+        self._open = []
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    # adds time measured elsewhere, e.g. in a worker process
+    def add_time(self, name, seconds, calls=1):
+        if self.enabled:
+            total, num_calls = self.timers.get(name, (0.0, 0))
+            self.timers[name] = (total + seconds, num_calls + calls)
+
+    def to_dict(self):
+        return {
+            "timers": {
+                name: {"total": total, "calls": calls}
+                for name, (total, calls) in self.timers.items()
+            },
+            "counters": dict(self.counters),
+            "memory_peak_bytes": dict(self.memory),
+        }
+
+    def to_json(self, path=None):
+        text = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        return text
+
+
+class _Phase:
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        if self.stats.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            # the enclosing phase keeps its peak across the reset below
+            if self.stats._open:
+                start, outer_peak = self.stats._open[-1]
+                self.stats._open[-1] = (start, max(outer_peak, peak))
+            tracemalloc.reset_peak()
+            self.stats._open.append((current, current))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add_time(self.name, time.perf_counter() - self.start)
+        if self.stats.track_memory and self.stats._open:
+            start, peak = self.stats._open.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            memory = self.stats.memory
+            memory[self.name] = max(memory.get(self.name, 0), peak - start)
+            if self.stats._open:
+                outer_start, outer_peak = self.stats._open[-1]
+                self.stats._open[-1] = (outer_start, max(outer_peak, peak))
+        return False
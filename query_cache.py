@@ -0,0 +1,255 @@
+"""
+Cache of query results (the distributions returned by solver.pr), shared by any
+solver.
+
+A query is keyed by a hash of the solver's class and settings, the graph's
+support, probabilities, ops and observations, the observations the solver holds
+itself (solver.observations, kept by the database solvers, whose observe_* never
+touch G), and the query's arguments. The
+graph's part of the key is recomputed only when G.version changes, which every
+observe_* call and op bumps, so a repeated query costs one dict lookup. Results are
+kept in memory up to max_bytes, evicting the least recently used first, and
+optionally persisted to a CompilationCache directory so later processes can reuse
+them.
+
+CachedSolver wraps a solver so that the usual flow of pr, observe_*, pr, ... goes
+through the cache. Because it sees every observation, it also passes
+use_cached=True to the solver whenever only observations changed since the
+solver last ran on the same graph, so callers no longer need to.
+
+Queries involving a lambda or a function defined inside another function (as an
+op, statistic or setting) cannot be told apart from others made by the same code,
+so they bypass the cache and are counted as uncacheable in metrics().
+
+Graphs changed other than through observe_* and operate (e.g. by editing
+G.observations directly) are not detected. Results of sampling solvers are cached
+like any other, so a repeated query returns the same sample.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import sys
+import weakref
+from collections import OrderedDict
+
+from compile_cache import CompilationCache
+from storage import fingerprint
+
+
+class QueryCache:
+    def __init__(self, max_bytes=64 << 20, directory=None, max_disk_entries=1024):
+        self.max_bytes = max_bytes
+        self.disk = (
+            None
+            if directory is None
+            else CompilationCache(directory, max_entries=max_disk_entries)
+        )
+        self.entries = OrderedDict()
+        self.num_bytes = 0
+        # G -> (G.version, hash of G) for graphs seen so far
+        self.graph_keys = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncacheable = 0
+
+    # hash of G, or None if an op cannot be identified
+    def graph_key(self, G):
+        version, digest = self.graph_keys.get(G, (None, None))
+        if version != G.version:
+            h = hashlib.sha256(fingerprint(G))
+            try:
+                h.update(json.dumps(describe(G.ops)).encode("utf-8"))
+                digest = h.hexdigest()
+            except Uncacheable:
+                digest = None
+            version = G.version
+            self.graph_keys[G] = (version, digest)
+        return digest
+
+    def key(self, solver, G, args=(), kwargs=None, observations=()):
+        """
+        Key of solver.pr(G, *args, **kwargs). Observations held by the solver
+        rather than by G (solver.observations, as the database solvers keep) are
+        part of the key, as are any extra observations passed in. Returns None if
+        the query involves a callable that cannot be identified (see describe),
+        in which case it must not be cached.
+        """
+        kwargs = {k: v for k, v in (kwargs or {}).items() if k != "use_cached"}
+        graph_key = self.graph_key(G)
+        try:
+            if graph_key is None:
+                raise Uncacheable("An op of G cannot be identified.")
+            payload = json.dumps(
+                [
+                    describe(solver),
+                    graph_key,
+                    describe(args),
+                    describe(kwargs),
+                    describe(getattr(solver, "observations", [])),
+                    describe(observations),
+                ]
+            )
+        except Uncacheable:
+            self.uncacheable += 1
+            return None
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns a copy of the cached result for key, or None.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(self.entries[key])
+        if self.disk is not None:
+            result = self.disk.load_pickle(key, "result.pkl")
+            if result is not None:
+                self.disk_hits += 1
+                self._store(key, result)
+                return dict(result)
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        self._store(key, dict(result))
+        if self.disk is not None:
+            self.disk.store_pickle(key, "result.pkl", self.entries[key])
+
+    def _store(self, key, result):
+        if key in self.entries:
+            self.num_bytes -= result_size(self.entries.pop(key))
+        self.entries[key] = result
+        self.num_bytes += result_size(result)
+        while self.num_bytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.num_bytes -= result_size(evicted)
+            self.evictions += 1
+
+    # solver.pr(G, *args, **kwargs) through the cache
+    def pr(self, solver, G, *args, **kwargs):
+        key = self.key(solver, G, args, kwargs)
+        if key is None:
+            return solver.pr(G, *args, **kwargs)
+        result = self.get(key)
+        if result is None:
+            result = solver.pr(G, *args, **kwargs)
+            self.put(key, result)
+        return result
+
+    def metrics(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "uncacheable": self.uncacheable,
+            "entries": len(self.entries),
+            "bytes": self.num_bytes,
+        }
+
+    def clear(self):
+        self.entries.clear()
+        self.num_bytes = 0
+
+
+class CachedSolver:
+    """
+    Wraps solver so that its queries go through cache (a new QueryCache if None).
+    Other attributes are forwarded to the solver.
+    """
+
+    def __init__(self, solver, cache=None):
+        self.solver = solver
+        self.cache = QueryCache() if cache is None else cache
+        self.observations = []
+        # the graph (and its number of ops) that solver.pr last ran on
+        self.solved = None
+        self.accepts_use_cached = (
+            "use_cached" in inspect.signature(solver.pr).parameters
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.solver, name)
+
+    def pr(self, G, *args, **kwargs):
+        key = self.cache.key(self.solver, G, args, kwargs, self.observations)
+        result = None if key is None else self.cache.get(key)
+        if result is not None:
+            return result
+
+        if self.accepts_use_cached and "use_cached" not in kwargs:
+            kwargs["use_cached"] = self.solved == (G, len(G.ops))
+        result = self.solver.pr(G, *args, **kwargs)
+        self.solved = (G, len(G.ops))
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    def observe_edge(self, G, s, t):
+        self.observations.append(((s, t), 1))
+        return self.solver.observe_edge(G, s, t)
+
+    def observe_no_edge(self, G, s, t):
+        self.observations.append(((s, t), 0))
+        return self.solver.observe_no_edge(G, s, t)
+
+    def observe_triangle(self, G, a, b, c):
+        self.observations.append(((a, b, c), 1))
+        return self.solver.observe_triangle(G, a, b, c)
+
+
+class Uncacheable(ValueError):
+    pass
+
+
+# approximate memory held by a result dict
+def result_size(result):
+    size = sys.getsizeof(result)
+    for k, v in result.items():
+        size += sys.getsizeof(k) + sys.getsizeof(v)
+    return size
+
+
+def describe(obj):
+    """
+    JSON-serializable description of obj for cache keys: values as themselves,
+    functions by qualified name, bound methods by their object and name, and other
+    objects by class and the attributes named like their constructor's parameters
+    (settings such as num_samples or seed, but not state such as a compiled model).
+
+    Lambdas and functions or classes defined inside another function share their
+    qualified names with every other one made by the same code, so they raise
+    Uncacheable instead.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return [describe(x) for x in obj]
+    if isinstance(obj, (set, frozenset)):
+        return sorted((describe(x) for x in obj), key=repr)
+    if isinstance(obj, dict):
+        return [[describe(k), describe(v)] for k, v in sorted(obj.items(), key=repr)]
+    if isinstance(obj, functools.partial):
+        return [describe(obj.func), describe(obj.args), describe(obj.keywords)]
+    if inspect.ismethod(obj):
+        return [describe(obj.__self__), obj.__func__.__qualname__]
+    if hasattr(obj, "__qualname__"):
+        if "<lambda>" in obj.__qualname__ or "<locals>" in obj.__qualname__:
+            raise Uncacheable(f"{obj.__qualname__} cannot be identified.")
+        return f"{obj.__module__}.{obj.__qualname__}"
+    attributes = getattr(obj, "__dict__", None)
+    if attributes is None:
+        return repr(obj)
+    settings = {
+        name: describe(attributes[name])
+        for name in inspect.signature(type(obj)).parameters
+        if name in attributes
+    }
+    return [describe(type(obj)), settings]
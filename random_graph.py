@@ -1,9 +1,13 @@
 import numpy as np
-from numpy.random import binomial, choice
+from graph import CSRGraph
+from utils import count_triangles
 
 
 class ExponentialRandomGraph:
     def __init__(self, initial_graph, num_nodes, num_links, deg_dist):
+        # initial_graph is a torch edge_index or a CSRGraph
+        if isinstance(initial_graph, CSRGraph):
+            initial_graph = initial_graph.edge_index()
         self.initial_graph = initial_graph
         self.num_nodes = num_nodes
         self.num_links = num_links
@@ -12,30 +16,82 @@ class ExponentialRandomGraph:
 
 class SampleableRandomGraph:
     def __init__(self, out_adj_list=None, undirected=True):
-        self.out_adj_list = out_adj_list
-        if self.out_adj_list is None:
-            # source : (target, prob)
-            self.out_adj_list = {0: {1: 1.0}, 1: {}}
-        self.num_nodes = len(self.out_adj_list)
+        # the support is a CSRGraph, or source : {target : prob}, which is converted
+        # to one; either way the support is fixed from here on
+        if out_adj_list is None:
+            out_adj_list = {0: {1: 1.0}, 1: {}}
+        if isinstance(out_adj_list, CSRGraph):
+            self.graph = out_adj_list
+            self._out_adj_list = None
+            undirected = self.graph.undirected
+        else:
+            self.graph = CSRGraph.from_adj_list(out_adj_list, undirected)
+            self._out_adj_list = out_adj_list
+        self.num_nodes = self.graph.num_nodes
         self.undirected = undirected
         self.ops = []
 
         # executes observations in order
         self.observations = []
+        # bumped by every observation and op, so caches can tell when a query's
+        # answer may have changed
+        self.version = 0
+
+    # source : {target : prob}, built on first use for graphs given as a CSRGraph
+    @property
+    def out_adj_list(self):
+        if self._out_adj_list is None:
+            self._out_adj_list = self.graph.to_adj_list()
+        return self._out_adj_list
 
     # func : out_adj_list, in_adj_list --> source, probs_list
     def operate(self, func):
         self.ops.append(func)
+        self.version += 1
+
+    # flat (sources, targets, probs) arrays over the support in CSRGraph edge order,
+    # followed by any observed edges outside of it so observations always have a
+    # column to pin
+    def edge_arrays(self):
+        sources, targets, probs = self.graph.edge_arrays()
+        extra = self._extra_edges()
+        if extra:
+            sources = np.concatenate([sources, [s for s, _ in extra]])
+            targets = np.concatenate([targets, [t for _, t in extra]])
+            probs = np.concatenate([probs, np.zeros(len(extra), dtype=probs.dtype)])
+        return sources, targets, probs
+
+    # observed edges outside of the support, in order of first observation
+    def _extra_edges(self):
+        extra = {}
+        for (s, t), _ in self.observations:
+            if self.graph.edge_id(s, t) is None:
+                extra.setdefault(self.edge_key(s, t), None)
+        return list(extra)
+
+    # column of edge (s, t) in edge_arrays()
+    def edge_column(self, s, t):
+        pos = self.graph.edge_id(s, t)
+        if pos is None:
+            return self.graph.num_edges + self._extra_edges().index(self.edge_key(s, t))
+        return pos
+
+    def edge_key(self, s, t):
+        if self.undirected and t < s:
+            return t, s
+        return s, t
 
     def observe_edge(self, s, t):
         self.observations.append(((s, t), 1))
+        self.version += 1
 
     def observe_no_edge(self, s, t):
         self.observations.append(((s, t), 0))
+        self.version += 1
 
     def observe_triangle(self, a, b, c):
         if not self.undirected:
-            return ValueError(
+            raise ValueError(
                 "Triangle observations are only supported for undirected graphs."
             )
 
@@ -43,52 +99,105 @@ class SampleableRandomGraph:
         self.observe_edge(b, c)
         self.observe_edge(a, c)
 
-    def sample(self, stat):
-        out_adj_list = {source: set() for source in self.out_adj_list}
-        in_adj_list = {source: set() for source in self.out_adj_list}
-
-        # initial independent sampling
-        for source in self.out_adj_list:
-            for target in self.out_adj_list[source]:
-                prob = self.out_adj_list[source][target]
-                create_edge = binomial(1, prob) == 1
-                if create_edge:
-                    out_adj_list[source].add(target)
-                    in_adj_list[target].add(source)
-                    if self.undirected:
-                        out_adj_list[target].add(source)
-                        in_adj_list[source].add(target)
+    # samples num_samples worlds at once as a (num_samples, num_edges) boolean
+    # matrix whose columns follow edge_arrays(); observations become column masks
+    # probs overrides the edge probabilities (e.g. with an importance-sampling
+    # proposal); observed edges are pinned either way
+    def sample_batch(self, num_samples, rng=None, packed=False, probs=None):
+        if self.ops:
+            raise ValueError("Batched sampling does not support ops.")
+
+        random = np.random if rng is None else rng
+        if probs is None:
+            _, _, probs = self.edge_arrays()
+        worlds = random.random((num_samples, len(probs))) < probs
 
         for (s, t), pos in self.observations:
-            if pos == 1:
-                out_adj_list[s].add(t)
-                in_adj_list[t].add(s)
-                if self.undirected:
-                    out_adj_list[t].add(s)
-                    in_adj_list[s].add(t)
-            else:
-                out_adj_list[s].remove(t)
-                in_adj_list[t].remove(s)
-                if self.undirected:
-                    out_adj_list[t].remove(s)
-                    in_adj_list[s].remove(t)
+            worlds[:, self.edge_column(s, t)] = pos == 1
+
+        if packed:
+            return np.packbits(worlds, axis=1)
+        return worlds
+
+    # (num_samples, num_nodes, num_nodes) boolean adjacency tensor for worlds
+    # returned by sample_batch
+    def to_adjacency(self, worlds, packed=False):
+        sources, targets, _ = self.edge_arrays()
+        if packed:
+            worlds = np.unpackbits(worlds, axis=1, count=len(sources)).astype(bool)
+
+        adj = np.zeros((worlds.shape[0], self.num_nodes, self.num_nodes), dtype=bool)
+        adj[:, sources, targets] = worlds
+        if self.undirected:
+            adj[:, targets, sources] = worlds
+        return adj
+
+    # latest observation of every observed edge: edge key -> observed present
+    def pinned_edges(self):
+        return {self.edge_key(s, t): pos == 1 for (s, t), pos in self.observations}
+
+    def add_edge(self, out_adj_list, in_adj_list, source, target):
+        out_adj_list[source].add(target)
+        in_adj_list[target].add(source)
+        if self.undirected:
+            out_adj_list[target].add(source)
+            in_adj_list[source].add(target)
+
+    # the independent part of a world as (out_adj_list, in_adj_list). Observed edges
+    # are pinned before sampling and never drawn, which conditions the independent
+    # edges exactly; observations on nodes that only ops add are left to the ops
+    def sample_initial(self, rng=None):
+        random = np.random if rng is None else rng
+        out_adj_list = {source: set() for source in range(self.num_nodes)}
+        in_adj_list = {source: set() for source in range(self.num_nodes)}
+        pinned = self.pinned_edges()
+
+        sources, targets, probs = self.graph.edge_arrays()
+        created = random.random(len(probs)) < probs
+        for source, target in zip(sources[created].tolist(), targets[created].tolist()):
+            if (source, target) not in pinned:
+                self.add_edge(out_adj_list, in_adj_list, source, target)
+
+        for (s, t), present in pinned.items():
+            if present and max(s, t) < self.num_nodes:
+                self.add_edge(out_adj_list, in_adj_list, s, t)
+        return out_adj_list, in_adj_list
+
+    # with ops, observations only constrain the independent edges; see
+    # conditioning.ParticleFilter for worlds conditioned after growth
+    def sample(self, stat=count_triangles, rng=None):
+        random = np.random if rng is None else rng
+        out_adj_list, in_adj_list = self.sample_initial(rng=random)
 
         for op in self.ops:
-            source, probs_list = op(out_adj_list, in_adj_list)
-
-            targets = []
-            for probs in probs_list:
-                targets.append(choice(len(out_adj_list), 1, p=probs)[0])
-
-            if source not in out_adj_list:
-                out_adj_list[source] = []
-                in_adj_list[source] = []
-
-            for target in targets:
-                out_adj_list[source].add(target)
-                in_adj_list[target].add(source)
-                if self.undirected:
-                    out_adj_list[target].add(source)
-                    in_adj_list[source].add(target)
-
+            # growth models add all of their nodes and edges in one call
+            if hasattr(op, "grow"):
+                sources, targets = op.grow(out_adj_list, in_adj_list, rng=random)
+                for source in range(
+                    len(out_adj_list), len(out_adj_list) + op.num_new_nodes
+                ):
+                    out_adj_list[source] = set()
+                    in_adj_list[source] = set()
+                edges = zip(sources.tolist(), targets.tolist())
+            else:
+                source, probs_list = op(out_adj_list, in_adj_list)
+
+                targets = []
+                for probs in probs_list:
+                    targets.append(random.choice(len(out_adj_list), 1, p=probs)[0])
+
+                if source not in out_adj_list:
+                    out_adj_list[source] = set()
+                    in_adj_list[source] = set()
+                edges = [(source, target) for target in targets]
+
+            for source, target in edges:
+                self.add_edge(out_adj_list, in_adj_list, source, target)
+
+        # with no statistic, the world itself is returned
+        if stat is None:
+            return out_adj_list, in_adj_list
+        # several statistics are evaluated on the same sampled world
+        if isinstance(stat, (list, tuple)):
+            return tuple(s(out_adj_list, in_adj_list) for s in stat)
         return stat(out_adj_list, in_adj_list)
@@ -0,0 +1,186 @@
+"""
+Binary on-disk formats for probabilistic graphs and their sampled worlds.
+
+A graph file is a 64-byte header (magic, format version, flags, num_nodes,
+num_edges) followed by the CSRGraph arrays (int32 indptr, int32 indices, float32
+probs), each starting on a 64-byte boundary. load_graph maps the arrays with
+numpy.memmap, so opening a graph does not read or parse the edges.
+
+A sample bank is a 64-byte header (magic, format version, num_edges, a
+fingerprint of the graph and observations the worlds were drawn under, and the
+number of worlds) followed by one row of np.packbits-packed edge bits per world,
+in the column order of SampleableRandomGraph.edge_arrays(). Worlds are appended
+at the end of the file and the count is updated once they are written, so a bank
+can be reopened and extended by any process, and an edgeless graph's worlds
+(rows of zero bytes) are still counted.
+"""
+
+import hashlib
+import os
+import struct
+import numpy as np
+
+from graph import CSRGraph
+
+FORMAT_VERSION = 1
+HEADER_SIZE = 64
+ALIGNMENT = 64
+
+GRAPH_MAGIC = b"RGPLCSR\x00"
+GRAPH_HEADER = struct.Struct("<8sIIQQ")
+UNDIRECTED_FLAG = 1
+
+BANK_MAGIC = b"RGPLBANK"
+BANK_HEADER = struct.Struct("<8sIIQ32sQ")
+BANK_VERSION = 2
+# offset of the world count, the last field of BANK_HEADER
+NUM_WORLDS = struct.Struct("<Q")
+NUM_WORLDS_OFFSET = BANK_HEADER.size - NUM_WORLDS.size
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _read_header(path, layout, magic, version=FORMAT_VERSION):
+    with open(path, "rb") as f:
+        fields = layout.unpack(f.read(layout.size))
+    if fields[0] != magic:
+        raise ValueError(f"{path} is not a {magic.rstrip(bytes(1)).decode()} file.")
+    if fields[1] != version:
+        raise ValueError(f"{path} has format version {fields[1]}, expected {version}.")
+    return fields
+
+
+# offsets of the indptr, indices and probs arrays in a graph file
+def _graph_offsets(num_nodes, num_edges):
+    indptr = HEADER_SIZE
+    indices = _aligned(indptr + 4 * (num_nodes + 1))
+    probs = _aligned(indices + 4 * num_edges)
+    return indptr, indices, probs
+
+
+def save_graph(path, graph):
+    flags = UNDIRECTED_FLAG if graph.undirected else 0
+    header = GRAPH_HEADER.pack(
+        GRAPH_MAGIC, FORMAT_VERSION, flags, graph.num_nodes, graph.num_edges
+    )
+    offsets = _graph_offsets(graph.num_nodes, graph.num_edges)
+    arrays = [graph.indptr, graph.indices, graph.probs]
+
+    with open(path, "wb") as f:
+        f.write(header.ljust(HEADER_SIZE, b"\x00"))
+        for offset, array in zip(offsets, arrays):
+            f.write(bytes(offset - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+
+
+def load_graph(path, mmap=True):
+    """
+    Opens a graph written by save_graph. With mmap, the arrays are read-only
+    memory maps of the file; otherwise they are read into memory.
+    """
+    _, _, flags, num_nodes, num_edges = _read_header(path, GRAPH_HEADER, GRAPH_MAGIC)
+    offsets = _graph_offsets(num_nodes, num_edges)
+    layout = [(np.int32, num_nodes + 1), (np.int32, num_edges), (np.float32, num_edges)]
+
+    arrays = []
+    for offset, (dtype, count) in zip(offsets, layout):
+        if mmap and count > 0:
+            arrays.append(
+                np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+            )
+        else:
+            arrays.append(np.fromfile(path, dtype=dtype, count=count, offset=offset))
+    return CSRGraph(num_nodes, *arrays, undirected=bool(flags & UNDIRECTED_FLAG))
+
+
+def fingerprint(G):
+    """
+    sha256 of G's support, probabilities and observations, which together fix the
+    distribution of the worlds that G.sample_batch draws.
+    """
+    h = hashlib.sha256()
+    h.update(struct.pack("<Q?", G.num_nodes, G.undirected))
+    for array in [G.graph.indptr, G.graph.indices, G.graph.probs]:
+        h.update(np.ascontiguousarray(array).tobytes())
+    h.update(repr(G.observations).encode("utf-8"))
+    return h.digest()
+
+
+class SampleBank:
+    """
+    Packed worlds of a SampleableRandomGraph G stored in the file at path. The file
+    is created if it does not exist; an existing file must have been written for a
+    graph with the same fingerprint.
+    """
+
+    def __init__(self, path, G):
+        self.path = path
+        self.num_edges = len(G.edge_arrays()[2])
+        self.row_bytes = -(-self.num_edges // 8)
+        key = fingerprint(G)
+
+        if not os.path.exists(path):
+            header = BANK_HEADER.pack(
+                BANK_MAGIC, BANK_VERSION, 0, self.num_edges, key, 0
+            )
+            with open(path, "wb") as f:
+                f.write(header.ljust(HEADER_SIZE, b"\x00"))
+        else:
+            fields = _read_header(path, BANK_HEADER, BANK_MAGIC, BANK_VERSION)
+            if fields[3] != self.num_edges or fields[4] != key:
+                raise ValueError(f"{path} holds worlds of a different graph.")
+
+    # the bank for G in directory, named by G's fingerprint so a new set of
+    # observations gets a new bank
+    @classmethod
+    def for_graph(cls, directory, G):
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, fingerprint(G).hex() + ".bank"), G)
+
+    def __len__(self):
+        with open(self.path, "rb") as f:
+            f.seek(NUM_WORLDS_OFFSET)
+            return NUM_WORLDS.unpack(f.read(NUM_WORLDS.size))[0]
+
+    def append(self, worlds, packed=False):
+        """
+        Appends worlds, either a (num_samples, num_edges) boolean matrix as returned by
+        G.sample_batch or its packed form.
+        """
+        if not packed:
+            worlds = np.packbits(worlds, axis=1)
+        if worlds.shape[1] != self.row_bytes:
+            raise ValueError(
+                f"Expected rows of {self.row_bytes} packed bytes, got {worlds.shape[1]}."
+            )
+        num_worlds = len(self)
+        with open(self.path, "r+b") as f:
+            f.seek(HEADER_SIZE + num_worlds * self.row_bytes)
+            f.write(np.ascontiguousarray(worlds, dtype=np.uint8).tobytes())
+            # the count is only updated after the rows, so a partially written
+            # append is ignored
+            f.flush()
+            f.seek(NUM_WORLDS_OFFSET)
+            f.write(NUM_WORLDS.pack(num_worlds + len(worlds)))
+
+    def worlds(self, start=0, stop=None, packed=True):
+        """
+        Worlds start..stop as a read-only memory map of packed rows, or unpacked to a
+        boolean matrix.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        if stop <= start or self.row_bytes == 0:
+            rows = np.zeros((max(stop - start, 0), self.row_bytes), dtype=np.uint8)
+        else:
+            rows = np.memmap(
+                self.path,
+                dtype=np.uint8,
+                mode="r",
+                offset=HEADER_SIZE + start * self.row_bytes,
+                shape=(stop - start, self.row_bytes),
+            )
+        if packed:
+            return rows
+        return np.unpackbits(rows, axis=1, count=self.num_edges).astype(bool)
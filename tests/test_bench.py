@@ -0,0 +1,55 @@
+import json
+import subprocess
+
+import pytest
+
+import bench
+
+
+def test_signal_is_reported_as_crash(monkeypatch):
+    def killed(command, **kwargs):
+        return subprocess.CompletedProcess(command, -9, stdout="", stderr="")
+
+    monkeypatch.setattr(bench.subprocess, "run", killed)
+    row = bench.run_isolated({"solver": "bn", "n": 8}, timeout=60)
+    assert row["status"] == "crashed"
+    assert row["error"] == "killed by signal 9"
+
+
+def test_large_support_has_no_reference():
+    case = {"solver": "elimination", "family": "ba", "n": 5, "p": 0.5, "q": 0.5}
+    small = bench.run_case(case)
+    assert small["reference"] == "streaming"
+    assert small["tv_error"] == pytest.approx(0.0, abs=1e-9)
+
+    large = bench.run_case(dict(case, n=12))
+    assert large["reference"] is None
+    assert "REFERENCE_MAX_EDGES" in large["reference_reason"]
+    assert large["tv_error"] is None
+
+
+def test_compare_flags_accuracy():
+    case = {"solver": "mc", "family": "er", "n": 8, "p": 0.5, "q": 0.5}
+    old = dict(case, status="ok", wall_time=1.0, tv_error=0.01)
+    unchecked = dict(old, tv_error=None, reference=None, reference_reason="too big")
+    worse = dict(old, tv_error=0.2)
+    same = dict(old, wall_time=1.1)
+
+    assert bench.compare([same], [old], 0.2, 0.05) == []
+    [(_, _, reason)] = bench.compare([unchecked], [old], 0.2, 0.05)
+    assert reason == "accuracy unchecked: too big"
+    [(_, _, reason)] = bench.compare([worse], [old], 0.2, 0.05)
+    assert reason.startswith("tv error")
+
+
+def test_plots_read_bench_results(tmp_path):
+    benchplots = pytest.importorskip("benchplots")
+    rows = [
+        {"n": 4, "status": "ok", "wall_time": 1.0},
+        {"n": 4, "status": "ok", "wall_time": 3.0},
+        {"n": 4, "status": "timeout", "wall_time": 60.0},
+        {"n": 8, "status": "crashed"},
+    ]
+    path = tmp_path / "results.json"
+    path.write_text(json.dumps({"environment": {}, "results": rows}))
+    assert benchplots.load_bench(path) == [{"n": 4, "mean": 2.0, "std": 1.0}]
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from bn import BayesianNetwork
+from database import ProbabilisticDatabase
+from random_graph import SampleableRandomGraph
+
+
+def random_probs(n, seed):
+    rng = np.random.default_rng(seed)
+    choices = [0.0, 0.2, 0.5, 0.9, 1.0]
+    return {
+        s: {t: float(rng.choice(choices)) for t in range(s + 1, n)} for s in range(n)
+    }
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_matches_database_with_observations(seed):
+    probs = random_probs(5, seed)
+    G = SampleableRandomGraph(probs)
+    bn = BayesianNetwork()
+    database = ProbabilisticDatabase(G)
+    rng = np.random.default_rng(seed)
+    edges = [(s, t) for s in probs for t in probs[s] if 0 < probs[s][t] < 1]
+    for i, idx in enumerate(
+        rng.choice(len(edges), min(3, len(edges)), replace=False).tolist()
+    ):
+        # the database lists counts of zero-probability worlds too
+        expected = {k: p for k, p in database.pr(G).items() if p > 0}
+        dist = bn.pr(G, use_cached=i > 0)
+        assert dist == pytest.approx(expected)
+
+        s, t = edges[idx]
+        if rng.random() < 0.5:
+            bn.observe_edge(G, s, t)
+            database.observe_edge(G, s, t)
+        else:
+            bn.observe_no_edge(G, s, t)
+            database.observe_no_edge(G, s, t)
+    expected = {k: p for k, p in database.pr(G).items() if p > 0}
+    assert bn.pr(G, use_cached=True) == pytest.approx(expected)
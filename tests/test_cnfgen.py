@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from cnfgen import Propositional
+from elimination import BucketElimination
+from random_graph import SampleableRandomGraph
+
+
+def random_probs(n, seed):
+    rng = np.random.default_rng(seed)
+    choices = [0.0, 0.3, 0.7, 1.0]
+    return {
+        s: {t: float(rng.choice(choices)) for t in range(s + 1, n)} for s in range(n)
+    }
+
+
+def assert_close(a, b):
+    assert set(a) == set(b)
+    for count in a:
+        assert a[count] == pytest.approx(b[count], abs=1e-12)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_elimination_as_observations_change(seed):
+    probs = random_probs(6, seed)
+    G = SampleableRandomGraph(probs)
+    solver = Propositional(G)
+    solver.stats.enable()
+    rng = np.random.default_rng(seed)
+    edges = [(s, t) for s in probs for t in probs[s]]
+    for idx in rng.choice(len(edges), 4, replace=False).tolist():
+        assert_close(solver.pr(G), BucketElimination().pr(G))
+        # observations stay possible, so the distributions stay normalized
+        s, t = edges[idx]
+        if probs[s][t] == 1.0 or (probs[s][t] > 0 and rng.random() < 0.5):
+            G.observe_edge(s, t)
+        else:
+            G.observe_no_edge(s, t)
+    assert_close(solver.pr(G), BucketElimination().pr(G))
+    # the support never changed, so the circuit was compiled once
+    assert solver.stats.to_dict()["counters"]["compilations"] == 1
+
+
+def test_recompiles_when_support_changes():
+    G = SampleableRandomGraph({0: {1: 0.5, 2: 0.5}, 1: {2: 0.0}, 2: {}})
+    solver = Propositional(G)
+    solver.stats.enable()
+    assert solver.pr(G) == {0: 1.0}
+    G.observe_edge(1, 2)
+    assert_close(solver.pr(G), {0: 0.75, 1: 0.25})
+    assert solver.stats.to_dict()["counters"]["compilations"] == 2
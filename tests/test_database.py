@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from bn import BayesianNetwork
+from cnfgen import Propositional
+from conditioning import ParticleFilter
+from database import ProbabilisticDatabase, StreamingProbabilisticDatabase
+from distributions import Decomposition
+from elimination import BucketElimination
+from mc import MonteCarlo
+from random_graph import SampleableRandomGraph
+
+
+@pytest.mark.parametrize(
+    "make_solver",
+    [
+        ProbabilisticDatabase,
+        StreamingProbabilisticDatabase,
+        lambda G: MonteCarlo(),
+        lambda G: BayesianNetwork(),
+        Propositional,
+        lambda G: BucketElimination(),
+        lambda G: Decomposition(),
+        lambda G: ParticleFilter(),
+    ],
+)
+def test_triangle_observation_on_directed_graph_raises(make_solver):
+    G = SampleableRandomGraph(
+        {0: {1: 0.5, 2: 0.5}, 1: {2: 0.5}, 2: {}}, undirected=False
+    )
+    solver = make_solver(G)
+    with pytest.raises(ValueError, match="undirected"):
+        solver.observe_triangle(G, 0, 1, 2)
+    assert getattr(solver, "observations", []) == []
+    assert G.observations == []
+
+
+def graph_with_loops(n, seed):
+    rng = np.random.default_rng(seed)
+    choices = [0.0, 0.3, 0.5, 1.0]
+    return {s: {t: float(rng.choice(choices)) for t in range(s, n)} for s in range(n)}
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize(
+    "observations", [[], [(0, 0, 1)], [(1, 1, 0), (0, 1, 1)], [(0, 2, 0)]]
+)
+def test_streaming_matches_database_with_self_loops(seed, observations):
+    probs = graph_with_loops(5, seed)
+    G = SampleableRandomGraph(probs)
+    streaming = StreamingProbabilisticDatabase(G)
+    database = ProbabilisticDatabase(G)
+    for s, t, present in observations:
+        if (probs[s][t] if present else 1 - probs[s][t]) == 0:
+            # the database cannot normalize an impossible observation
+            return
+        for solver in (streaming, database):
+            if present:
+                solver.observe_edge(G, s, t)
+            else:
+                solver.observe_no_edge(G, s, t)
+
+    # the database also lists counts of worlds with probability zero
+    expected = {count: prob for count, prob in database.pr(G).items() if prob > 0}
+    dist = {count: prob for count, prob in streaming.pr(G).items() if prob > 0}
+    assert min(dist) >= 0
+    assert dist.keys() == expected.keys()
+    for count, prob in expected.items():
+        assert dist[count] == pytest.approx(prob)
+
+
+def test_streaming_ignores_self_loops():
+    G = SampleableRandomGraph({0: {0: 0.5, 1: 0.5, 2: 0.5}, 1: {2: 0.5}, 2: {}})
+    assert StreamingProbabilisticDatabase(G).pr(G) == pytest.approx(
+        {0: 0.875, 1: 0.125}
+    )
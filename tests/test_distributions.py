@@ -0,0 +1,81 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from distributions import Decomposition, convolve, convolve_all, triangle_groups
+from elimination import BucketElimination
+from random_graph import SampleableRandomGraph
+
+
+def clique(nodes):
+    return list(itertools.combinations(nodes, 2))
+
+
+# one triangle group per exact backend and one for the fallback, with edge
+# probabilities drawn from seed
+def multi_group_graph(seed):
+    edges = (
+        clique(range(0, 3))  # 3 edges: enumerated
+        + clique(range(3, 8))  # 10 edges: enumerated
+        # a triangulated strip: 15 edges in one group, but narrow bags
+        + [(i, i + 1) for i in range(8, 16)]
+        + [(i, i + 2) for i in range(8, 15)]
+        + clique(range(17, 23))  # 15 edges in wide bags: fallback
+        + [(23, 24), (2, 3)]  # on no triangle
+    )
+    rng = np.random.default_rng(seed)
+    probs = {node: {} for node in range(25)}
+    for s, t in edges:
+        probs[s][t] = float(rng.choice([0.3, 0.5, 0.8]))
+    return probs
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_dispatch_matches_single_exact_solver(seed):
+    G = SampleableRandomGraph(multi_group_graph(seed))
+    G.observe_edge(8, 9)
+    G.observe_no_edge(17, 18)
+    solver = Decomposition(
+        max_enumerate_edges=12, max_bag_edges=6, fallback=BucketElimination()
+    )
+    dist = solver.pr(G)
+    assert solver.diagnostics["backends"] == {
+        "streaming": 2,
+        "elimination": 1,
+        "BucketElimination": 1,
+    }
+    assert solver.diagnostics["largest_group"] == 15
+
+    expected = BucketElimination().pr(G)
+    assert dist.keys() == expected.keys()
+    for count, prob in expected.items():
+        assert dist[count] == pytest.approx(prob, abs=1e-12)
+
+
+def test_dense_group_without_fallback_raises():
+    G = SampleableRandomGraph(multi_group_graph(0))
+    with pytest.raises(ValueError, match="fallback"):
+        Decomposition(max_bag_edges=6).pr(G)
+
+
+def test_triangle_groups_split_at_shared_vertices():
+    # two triangles sharing vertex 0, and an edge on no triangle
+    edges = sorted([(0, 1), (0, 2), (1, 2), (0, 3), (0, 4), (3, 4), (4, 5)])
+    groups = triangle_groups(edges)
+    assert sorted(sorted(edges[e] for e in group) for group in groups) == [
+        [(0, 1), (0, 2), (1, 2)],
+        [(0, 3), (0, 4), (3, 4)],
+    ]
+
+
+# sparse, direct and FFT products
+@pytest.mark.parametrize("sizes", [(3, 8), (40, 200), (300, 305)])
+def test_convolve_paths_agree(sizes):
+    rng = np.random.default_rng(sizes)
+    a, b = (dict(enumerate((rng.random(n) / n).tolist())) for n in sizes)
+    expected = np.convolve(list(a.values()), list(b.values()))
+    dist = convolve(a, b)
+    assert [dist.get(k, 0.0) for k in range(len(expected))] == pytest.approx(expected)
+    assert convolve_all([a, b, {0: 1.0}]) == pytest.approx(dist)
+    assert convolve_all([]) == {0: 1.0}
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from database import StreamingProbabilisticDatabase
+from elimination import BucketElimination
+from random_graph import SampleableRandomGraph
+
+
+def random_probs(n, seed, self_loops=False):
+    rng = np.random.default_rng(seed)
+    choices = [0.0, 0.3, 0.5, 0.8, 1.0]
+    return {
+        s: {t: float(rng.choice(choices)) for t in range(s if self_loops else s + 1, n)}
+        for s in range(n)
+    }
+
+
+# exact distribution by enumerating the worlds consistent with G's observations
+def enumerate_worlds(G):
+    solver = StreamingProbabilisticDatabase(G)
+    for (s, t), pos in G.observations:
+        if pos == 1:
+            solver.observe_edge(G, s, t)
+        else:
+            solver.observe_no_edge(G, s, t)
+    dist = solver.pr(G)
+    total = sum(dist.values())
+    return {count: prob / total for count, prob in dist.items() if prob > 0}
+
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("self_loops", [False, True])
+def test_matches_enumeration(seed, self_loops):
+    G = SampleableRandomGraph(random_probs(6, seed, self_loops))
+    assert BucketElimination().pr(G) == pytest.approx(enumerate_worlds(G))
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_matches_enumeration_with_pinned_edges(seed):
+    probs = random_probs(6, seed, self_loops=True)
+    G = SampleableRandomGraph(probs)
+    solver = BucketElimination()
+    rng = np.random.default_rng(seed)
+    possible = [(s, t) for s in probs for t in probs[s] if 0 < probs[s][t] < 1]
+    for idx in rng.choice(len(possible), min(4, len(possible)), replace=False):
+        s, t = possible[idx]
+        if rng.random() < 0.5:
+            solver.observe_edge(G, s, t)
+        else:
+            solver.observe_no_edge(G, s, t)
+        assert solver.pr(G, use_cached=True) == pytest.approx(enumerate_worlds(G))
+
+
+def test_impossible_observation_is_empty():
+    G = SampleableRandomGraph({0: {1: 1.0, 2: 0.5}, 1: {2: 0.5}, 2: {}})
+    solver = BucketElimination()
+    solver.observe_no_edge(G, 0, 1)
+    assert solver.pr(G) == {}
+
+    # a positive observation of an edge outside the support
+    G = SampleableRandomGraph({0: {1: 0.5, 2: 0.0}, 1: {2: 0.5}, 2: {}})
+    solver.observe_edge(G, 0, 2)
+    assert solver.pr(G) == {}
+
+    # an impossible self-loop observation too, though loops are never counted
+    G = SampleableRandomGraph({0: {0: 0.0, 1: 0.5}, 1: {}})
+    solver.observe_edge(G, 0, 0)
+    assert solver.pr(G) == {}
+
+
+def test_too_wide_support_raises():
+    G = SampleableRandomGraph({s: {t: 0.5 for t in range(s + 1, 6)} for s in range(6)})
+    with pytest.raises(ValueError, match="max_bag_edges"):
+        BucketElimination(max_bag_edges=6).pr(G)
+    # the same support fits the default bound
+    assert sum(BucketElimination().pr(G).values()) == pytest.approx(1.0)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from growth import PreferentialAttachment, attach, iter_uniforms
+
+
+def test_attach_draws_only_what_it_needs():
+    # one new node on a star draws about m uniforms, not a fixed large chunk
+    rng = np.random.default_rng(0)
+    attach([3, 1, 1, 1], 1, m=2, rng=rng)
+    assert rng.bit_generator.state == _after_draws(2)
+
+
+def test_grow_targets_are_distinct_and_degree_proportional():
+    op = PreferentialAttachment(num_new_nodes=1, m=2)
+    in_adj_list = {
+        0: {1, 2, 3, 4, 5, 6},
+        1: {0},
+        2: {0},
+        3: {0},
+        4: {0},
+        5: {0},
+        6: {0},
+    }
+    out_adj_list = {node: set(nbrs) for node, nbrs in in_adj_list.items()}
+    rng = np.random.default_rng(1)
+    uniforms = iter_uniforms(rng, 2 * 5000)
+    hub = 0
+    for _ in range(5000):
+        sources, targets = op.grow(out_adj_list, in_adj_list, uniforms=uniforms)
+        assert sources.tolist() == [7, 7]
+        assert len(set(targets.tolist())) == 2
+        hub += 0 in targets.tolist()
+    # the hub holds half of the degree, so it is the first target half of the time,
+    # and otherwise the second with probability 6 / 11 once the leaf is excluded
+    exact = 0.5 + 0.5 * 6 / 11
+    assert abs(hub / 5000 - exact) < 0.03
+
+
+def _after_draws(n):
+    rng = np.random.default_rng(0)
+    rng.random(n)
+    return rng.bit_generator.state
+
+
+@pytest.mark.parametrize(
+    "degrees, m, offset",
+    [
+        # an existing node would have a negative weight
+        ([3, 1, 1, 1], 2, -2.0),
+        # existing nodes are fine, but new nodes join with degree m = 1
+        ([3, 2, 2, 3], 1, -2.0),
+    ],
+)
+def test_negative_weights_raise(degrees, m, offset):
+    with pytest.raises(ValueError, match="offset"):
+        attach(degrees, 5, m, np.random.default_rng(0), offset=offset)
+
+
+def test_offset_down_to_minus_the_smallest_degree():
+    rng = np.random.default_rng(0)
+    sources, targets = attach([3, 1, 1, 1], 50, 2, rng, offset=-1.0)
+    # only the hub has a positive weight, and new nodes join with weight zero
+    assert sources.tolist() == list(range(4, 54))
+    assert targets.tolist() == [0] * 50
@@ -0,0 +1,36 @@
+import pytest
+
+from database import StreamingProbabilisticDatabase
+from importance import ImportanceSampling
+from random_graph import SampleableRandomGraph
+
+
+def complete_graph(n, p):
+    return {s: {t: p for t in range(s + 1, n)} for s in range(n)}
+
+
+def exact_tail(G, threshold):
+    dist = StreamingProbabilisticDatabase(G).pr(G)
+    return sum(prob for count, prob in dist.items() if count >= threshold)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_cross_entropy_levels_progress_through_ties(seed):
+    # most pilot worlds have no triangles, so the quantile ties at 0 for a while
+    G = SampleableRandomGraph(complete_graph(6, 0.1))
+    solver = ImportanceSampling(num_samples=4000, seed=seed)
+    estimate, variance = solver.pr_tail(G, 4)
+
+    levels = solver.diagnostics["levels"]
+    assert all(a < b for a, b in zip(levels, levels[1:]))
+    assert levels[-1] == 4
+    assert solver.diagnostics["converged"]
+    assert estimate == pytest.approx(exact_tail(G, 4), rel=0.5)
+
+
+def test_cross_entropy_unreachable_threshold_raises():
+    G = SampleableRandomGraph(complete_graph(4, 0.5))
+    solver = ImportanceSampling(num_samples=100, pilot_samples=200, seed=0)
+    with pytest.raises(ValueError):
+        solver.pr_tail(G, 5)
+    assert not solver.diagnostics["converged"]
@@ -0,0 +1,116 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from mc import SEED_BLOCK, MonteCarlo, seed_blocks, wilson_errors
+from random_graph import SampleableRandomGraph
+from utils import count_triangles
+
+
+def complete_graph(n, p):
+    return {s: {t: p for t in range(s + 1, n)} for s in range(n)}
+
+
+def timers(solver):
+    return solver.stats.to_dict()["timers"]
+
+
+def test_per_world_sampling_times_statistic_separately():
+    G = SampleableRandomGraph(complete_graph(6, 0.5))
+    solver = MonteCarlo(num_samples=200, seed=0)
+    solver.stats.enable()
+    dist = solver.pr(G, stat=count_triangles)
+    assert timers(solver)["sample"]["calls"] == 200
+    assert timers(solver)["statistic"]["calls"] == 200
+    assert timers(solver)["statistic"]["total"] > 0
+
+    # the same worlds and counts as evaluating the statistic inside G.sample
+    [(_, seed)] = seed_blocks(0, 200)
+    rng = np.random.default_rng(seed)
+    counts = Counter(G.sample(count_triangles, rng=rng) for _ in range(200))
+    assert dist == {count: num / 200 for count, num in counts.items()}
+
+
+def test_bank_reads_are_timed_as_load(tmp_path):
+    G = SampleableRandomGraph(complete_graph(6, 0.5))
+    MonteCarlo(num_samples=500, batch_size=100, seed=0, bank_dir=tmp_path).pr(G)
+
+    solver = MonteCarlo(num_samples=500, batch_size=100, bank_dir=tmp_path)
+    solver.stats.enable()
+    solver.pr(G)
+    assert "sample" not in timers(solver)
+    assert timers(solver)["load"]["calls"] == 5
+    assert timers(solver)["statistic"]["calls"] == 5
+
+
+def test_incremental_resamples_when_settings_change():
+    G = SampleableRandomGraph(complete_graph(6, 0.5))
+    solver = MonteCarlo(num_samples=500, seed=0, incremental=True)
+    solver.pr(G)
+
+    solver.num_samples = 800
+    dist = solver.pr(G)
+    assert sum(dist.values()) == pytest.approx(1.0)
+    assert dist == MonteCarlo(num_samples=800, seed=0, incremental=True).pr(G)
+
+    solver.seed = 1
+    assert solver.pr(G) == MonteCarlo(num_samples=800, seed=1, incremental=True).pr(G)
+
+
+def test_incremental_self_loop_observation_keeps_counts():
+    probs = complete_graph(6, 0.5)
+    probs[0][0] = 0.5
+    G = SampleableRandomGraph(probs)
+    solver = MonteCarlo(num_samples=500, seed=0, incremental=True)
+    before = solver.pr(G)
+    solver.observe_edge(G, 0, 0)
+    assert solver.pr(G) == before
+
+
+@pytest.mark.parametrize("batch_size", [None, 100])
+def test_seeded_result_does_not_depend_on_workers(batch_size):
+    G = SampleableRandomGraph(complete_graph(6, 0.5))
+    # more samples than one seed block, split unevenly across the workers
+    num_samples = 2 * SEED_BLOCK + 100
+    serial = MonteCarlo(num_samples, batch_size=batch_size, seed=0).pr(G)
+    parallel = MonteCarlo(num_samples, batch_size=batch_size, workers=2, seed=0).pr(G)
+    assert parallel == serial
+    assert serial == MonteCarlo(num_samples, seed=0).pr(G)
+
+
+@pytest.mark.parametrize("criterion", ["ci", "tv"])
+def test_adaptive_stops_once_within_tolerance(criterion):
+    G = SampleableRandomGraph(complete_graph(5, 0.5))
+    settings = dict(criterion=criterion, tolerance=0.05, batch_size=200)
+    dist, num_samples, errors = MonteCarlo(seed=0).pr_adaptive(
+        G, max_samples=10**5, **settings
+    )
+    assert num_samples < 10**5
+    assert errors[criterion] <= 0.05
+    assert sum(dist.values()) == pytest.approx(1.0)
+
+    # one batch fewer (the same worlds, as the seed is fixed) was not yet enough
+    _, fewer, errors = MonteCarlo(seed=0).pr_adaptive(
+        G, max_samples=num_samples - 200, **settings
+    )
+    assert fewer == num_samples - 200
+    assert errors[criterion] > 0.05
+
+
+def test_adaptive_runs_to_the_cap_when_tolerance_is_unreachable():
+    G = SampleableRandomGraph(complete_graph(5, 0.5))
+    _, num_samples, errors = MonteCarlo(seed=0).pr_adaptive(
+        G, tolerance=1e-6, batch_size=300, max_samples=1000
+    )
+    assert num_samples == 1000
+    assert errors["ci"] > 1e-6
+
+
+def test_wilson_errors():
+    z = 1.96
+    errors = wilson_errors({0: 50, 1: 50}, 100, z)
+    half_width = z / (1 + z**2 / 100) * np.sqrt(0.25 / 100 + z**2 / 40000)
+    assert errors["bins"] == pytest.approx({0: half_width, 1: half_width})
+    assert errors["ci"] == pytest.approx(half_width)
+    assert errors["tv"] == pytest.approx(half_width)
@@ -0,0 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+from torch.distributions.categorical import Categorical
+
+import mcmc
+from mcmc import MarkovChainMonteCarlo
+from random_graph import ExponentialRandomGraph
+
+
+def test_workers_share_one_pool_across_rounds(monkeypatch):
+    pools = []
+    shutdowns = []
+
+    class CountingPool(ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            pools.append(self)
+
+        def shutdown(self, *args, **kwargs):
+            shutdowns.append(self)
+            super().shutdown(*args, **kwargs)
+
+    monkeypatch.setattr(mcmc, "ProcessPoolExecutor", CountingPool)
+    # a 6-cycle with 9 links to place
+    u = torch.arange(6)
+    v = (u + 1) % 6
+    edge_index = torch.stack([torch.cat([u, v]), torch.cat([v, u])])
+    G = ExponentialRandomGraph(edge_index, 6, 9, Categorical(torch.ones(6) / 6))
+    settings = dict(num_samples=200, num_chains=2, seed=0, check_every=50)
+    serial = list(MarkovChainMonteCarlo(**settings).iter_samples(G))
+    parallel = list(MarkovChainMonteCarlo(workers=2, **settings).iter_samples(G))
+
+    assert len(pools) == 1
+    assert shutdowns == pools
+    assert parallel == serial
@@ -0,0 +1,103 @@
+import pytest
+
+from database import ProbabilisticDatabase, StreamingProbabilisticDatabase
+from growth import PreferentialAttachment
+from mc import MonteCarlo
+from query_cache import CachedSolver, QueryCache
+from random_graph import SampleableRandomGraph
+from utils import BA
+
+
+def complete_graph(n, p):
+    return {s: {t: p for t in range(s + 1, n)} for s in range(n)}
+
+
+@pytest.mark.parametrize(
+    "make_solver", [ProbabilisticDatabase, StreamingProbabilisticDatabase]
+)
+def test_database_observations_invalidate(make_solver):
+    G = SampleableRandomGraph(complete_graph(5, 0.5))
+    cache = QueryCache()
+    solver = make_solver(G)
+    unconditioned = cache.pr(solver, G)
+
+    # observed through the solver only; G is unchanged
+    solver.observe_edge(G, 0, 1)
+    solver.observe_edge(G, 1, 2)
+    solver.observe_edge(G, 0, 2)
+    conditioned = cache.pr(solver, G)
+    assert conditioned != unconditioned
+    assert 0 not in conditioned
+    assert cache.metrics()["hits"] == 0
+
+    reference = make_solver(SampleableRandomGraph(complete_graph(5, 0.5)))
+    reference.observe_triangle(G, 0, 1, 2)
+    assert conditioned == pytest.approx(reference.pr(G))
+    assert cache.pr(solver, G) == conditioned
+    assert cache.metrics()["hits"] == 1
+
+
+@pytest.mark.parametrize(
+    "make_solver", [ProbabilisticDatabase, StreamingProbabilisticDatabase]
+)
+def test_cached_database_solver(make_solver):
+    G = SampleableRandomGraph(complete_graph(5, 0.5))
+    solver = CachedSolver(make_solver(G))
+    reference = make_solver(G)
+    for observe in [
+        lambda s: s.observe_edge(G, 0, 1),
+        lambda s: s.observe_no_edge(G, 2, 3),
+    ]:
+        before = solver.pr(G)
+        observe(solver)
+        observe(reference)
+        after = solver.pr(G)
+        assert after != before
+        assert after == pytest.approx(reference.pr(G))
+
+
+def attach_op(m):
+    # every op made here shares the qualified name attach_op.<locals>.op
+    def op(out_adj_list, in_adj_list):
+        return BA(out_adj_list, in_adj_list, m=m)
+
+    return op
+
+
+@pytest.mark.parametrize(
+    "make_ops",
+    [
+        lambda: [lambda o, i: BA(o, i, m=1), lambda o, i: BA(o, i, m=3)],
+        lambda: [attach_op(1), attach_op(3)],
+    ],
+)
+def test_unnamed_ops_are_not_cached(make_ops):
+    cache = QueryCache()
+    dists = []
+    for op in make_ops():
+        G = SampleableRandomGraph(complete_graph(4, 0.5))
+        for _ in range(3):
+            G.operate(op)
+        dists.append(cache.pr(MonteCarlo(num_samples=500, seed=0), G))
+    assert dists[0] != dists[1]
+    assert cache.metrics()["hits"] == 0
+    assert cache.metrics()["uncacheable"] == 2
+
+
+def test_lambda_statistics_are_not_cached():
+    cache = QueryCache()
+    G = SampleableRandomGraph(complete_graph(5, 0.5))
+    solver = MonteCarlo(num_samples=200, seed=0)
+    edges = cache.pr(solver, G, lambda o, i: sum(map(len, o.values())))
+    nodes = cache.pr(solver, G, lambda o, i: len(o))
+    assert edges != nodes
+    assert cache.metrics()["uncacheable"] == 2
+
+
+def test_named_ops_are_cached():
+    cache = QueryCache()
+    for _ in range(2):
+        G = SampleableRandomGraph(complete_graph(4, 0.5))
+        G.operate(PreferentialAttachment(3, 2))
+        cache.pr(MonteCarlo(num_samples=200, seed=0), G)
+    assert cache.metrics()["hits"] == 1
@@ -0,0 +1,44 @@
+import pytest
+
+from mc import MonteCarlo
+from random_graph import SampleableRandomGraph
+from storage import SampleBank
+
+
+def sbm(n, p, q):
+    return {
+        s: {t: p if (s < n // 2) == (t < n // 2) else q for t in range(s + 1, n)}
+        for s in range(n)
+    }
+
+
+@pytest.mark.parametrize("batch_size", [None, 300, 1000])
+def test_bank_larger_than_num_samples(tmp_path, batch_size):
+    G = SampleableRandomGraph(sbm(6, 0.6, 0.3))
+    MonteCarlo(num_samples=1200, batch_size=batch_size, seed=0, bank_dir=tmp_path).pr(G)
+    assert len(SampleBank.for_graph(tmp_path, G)) == 1200
+
+    solver = MonteCarlo(num_samples=1000, batch_size=batch_size, bank_dir=tmp_path)
+    dist = solver.pr(G)
+    assert sum(dist.values()) == pytest.approx(1.0)
+    assert len(SampleBank.for_graph(tmp_path, G)) == 1200
+
+
+def test_bank_of_edgeless_graph(tmp_path):
+    G = SampleableRandomGraph({s: {} for s in range(4)})
+    assert MonteCarlo(num_samples=500, seed=0, bank_dir=tmp_path).pr(G) == {0: 1.0}
+    bank = SampleBank.for_graph(tmp_path, G)
+    assert len(bank) == 500
+    assert bank.worlds(100, 200, packed=False).shape == (100, 0)
+
+
+def test_bank_ignores_partial_rows(tmp_path):
+    G = SampleableRandomGraph(sbm(6, 0.6, 0.3))
+    bank = SampleBank(tmp_path / "worlds.bank", G)
+    bank.append(G.sample_batch(10))
+    with open(bank.path, "ab") as f:
+        f.write(bytes(bank.row_bytes - 1))
+    assert len(SampleBank(bank.path, G)) == 10
+    bank.append(G.sample_batch(5))
+    assert len(bank) == 15
+    assert bank.worlds(packed=False).shape == (15, bank.num_edges)
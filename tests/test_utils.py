@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from utils import (
+    count_triangles,
+    count_triangles_batch,
+    count_triangles_dense,
+    count_triangles_intersect,
+    count_triangles_naive,
+)
+
+
+def random_graph(n, p, directed, self_loops, rng):
+    out_adj_list = {node: set() for node in range(n)}
+    in_adj_list = {node: set() for node in range(n)}
+    for s in range(n):
+        for t in range(n if directed else s + 1):
+            if (s != t or self_loops) and rng.random() < p:
+                out_adj_list[s].add(t)
+                in_adj_list[t].add(s)
+                if not directed:
+                    out_adj_list[t].add(s)
+                    in_adj_list[s].add(t)
+    return out_adj_list, in_adj_list
+
+
+def batched(out_adj_list, in_adj_list):
+    adj = np.zeros((1, len(out_adj_list), len(out_adj_list)), dtype=bool)
+    for s, targets in out_adj_list.items():
+        adj[0, s, list(targets)] = True
+    return int(count_triangles_batch(adj)[0])
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [
+        count_triangles_intersect,
+        count_triangles_dense,
+        count_triangles_naive,
+        batched,
+    ],
+)
+@pytest.mark.parametrize("directed", [False, True])
+@pytest.mark.parametrize("self_loops", [False, True])
+# 40 nodes at p = 0.5 is dense enough for count_triangles to use the dense backend
+@pytest.mark.parametrize("n, p", [(1, 0.5), (3, 1.0), (12, 0.3), (25, 0.15), (40, 0.5)])
+def test_backends_agree(backend, directed, self_loops, n, p):
+    rng = np.random.default_rng([n, directed, self_loops])
+    for _ in range(5):
+        graph = random_graph(n, p, directed, self_loops, rng)
+        assert backend(*graph) == count_triangles(*graph)